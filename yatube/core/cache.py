@@ -0,0 +1,157 @@
+"""Версии для ключей фрагментного кеша.
+
+Вместо того чтобы ждать истечения таймаута, фрагменты включают в ключ
+версию своих данных. Изменение данных увеличивает версию, и следующий
+запрос уже не найдёт старый фрагмент, а сами фрагменты могут жить часами.
+
+Версия "site" входит в каждый ключ: её поднимают редкие глобальные
+изменения (переименование группы или пользователя).
+
+Вместе с версией хранится время последнего изменения области:
+get_validators отдаёт и то, и другое для условных GET (ETag и
+Last-Modified), не трогая данные самих страниц.
+
+get_or_compute защищает горячие ключи от "давки" (cache stampede): при
+истечении значение пересчитывает один процесс, остальные тем временем
+отдают устаревшее, а вероятностный ранний пересчёт (XFetch) размазывает
+пересчёты по времени ещё до истечения.
+"""
+import math
+import random
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import metrics
+
+VERSION_KEY = 'cache-version:{}'
+MODIFIED_KEY = 'cache-modified:{}'
+SITE = 'site'
+LOCK_KEY = '{}:lock'
+# Сколько секунд держится блокировка пересчёта и ждут остальные процессы
+LOCK_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+
+# Исходы get_or_compute: hit, stale (отдано устаревшее, пока считает
+# другой процесс), recompute (ранний или просроченный пересчёт), miss,
+# wait (дождались чужого пересчёта)
+LOOKUPS = metrics.Counter(
+    'yatube_fragment_cache_total', 'Обращения к кешу фрагментов по исходу')
+
+
+def _initial():
+    # Версия, потерянная при вытеснении, начинается с текущего времени и
+    # поэтому не совпадает ни с одной из выданных ранее
+    return int(time.time() * 1000)
+
+
+def get_version(*scopes):
+    """Общая версия для набора областей, например ('post:1', 'author:2')."""
+    scopes = (SITE,) + scopes
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for scope, key in zip(scopes, keys):
+        if key not in versions:
+            if cache.add(key, _initial(), timeout=None):
+                # Данные могли измениться, пока версии не было
+                cache.set(
+                    MODIFIED_KEY.format(scope), time.time(), timeout=None)
+            versions[key] = cache.get(key)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def get_validators(*scopes):
+    """Версия набора областей и время его последнего изменения.
+
+    Время - None, если оно для какой-то из областей потеряно.
+    """
+    version = get_version(*scopes)
+    keys = [MODIFIED_KEY.format(scope) for scope in (SITE,) + scopes]
+    modified = cache.get_many(keys)
+    if len(modified) < len(keys):
+        return version, None
+    return version, max(modified.values())
+
+
+def bump(*scopes):
+    """Инвалидирует все фрагменты, зависящие от перечисленных областей."""
+    now = time.time()
+    for scope in scopes:
+        key = VERSION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial(), timeout=None)
+    cache.set_many(
+        {MODIFIED_KEY.format(scope): now for scope in scopes}, timeout=None)
+
+
+def bump_on_commit(*scopes):
+    """bump сейчас и ещё раз после коммита текущей транзакции.
+
+    Между первым подъёмом и коммитом параллельный запрос ещё видит
+    старые строки и может сохранить страницу под новой версией; второй
+    подъём после коммита делает эту копию недостижимой. Вне транзакции
+    версия поднимается один раз.
+    """
+    bump(*scopes)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: bump(*scopes))
+
+
+def _locks():
+    # Блокировкам не нужен процессный уровень двухуровневого кеша:
+    # они живут секунды и должны быть видны всем процессам сразу
+    return getattr(cache, 'shared', cache)
+
+
+def _store(key, compute, timeout):
+    started = time.time()
+    # Блокировка снимается только после записи: иначе процесс, пришедший
+    # между ними, не застал бы нового значения и посчитал бы его заново
+    try:
+        value = compute()
+        finished = time.time()
+        # Запись живёт дольше логического срока, чтобы было что отдать,
+        # пока один процесс пересчитывает значение
+        entry = (value, finished - started, finished + timeout)
+        cache.set(key, entry, timeout * 2)
+    finally:
+        _locks().delete(LOCK_KEY.format(key))
+    return value
+
+
+def get_or_compute(key, compute, timeout, beta=1.0, name='other'):
+    """Значение из кеша или compute() с защитой от одновременных пересчётов.
+
+    beta управляет ранним пересчётом: чем больше, тем раньше срока и
+    чаще; 0 отключает его. name - метка в метриках попаданий.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires = entry
+        # XFetch: чем дольше считается значение и чем ближе срок,
+        # тем вероятнее пересчёт прямо сейчас
+        early = -delta * beta * math.log(1 - random.random())
+        if time.time() + early < expires:
+            LOOKUPS.inc(fragment=name, result='hit')
+            return value
+        if not _locks().add(LOCK_KEY.format(key), 1, LOCK_TIMEOUT):
+            LOOKUPS.inc(fragment=name, result='stale')
+            return value
+        LOOKUPS.inc(fragment=name, result='recompute')
+        return _store(key, compute, timeout)
+    if _locks().add(LOCK_KEY.format(key), 1, LOCK_TIMEOUT):
+        LOOKUPS.inc(fragment=name, result='miss')
+        return _store(key, compute, timeout)
+    # Значения нет совсем: ждём, пока его посчитает владелец блокировки
+    deadline = time.time() + LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            LOOKUPS.inc(fragment=name, result='wait')
+            return entry[0]
+    LOOKUPS.inc(fragment=name, result='miss')
+    return compute()
@@ -0,0 +1,352 @@
+"""Кеш-бэкенды: общий SQLite-кеш и двухуровневый кеш поверх него.
+
+TieredCache держит в каждом процессе небольшой LRU (L1) перед общим
+для всех процессов кешем (L2). Согласованность обеспечивает номер
+поколения в L2: удаление, incr и clear увеличивают его, а процесс,
+заметивший новое поколение, сбрасывает свой L1. Поколение проверяется
+не чаще раза в COHERENCE_INTERVAL секунд, поэтому чужая инвалидация
+видна с такой задержкой; перезапись ключа через set() другим процессом
+видна не позже L1_TIMEOUT.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+
+GENERATION_KEY = 'tiered-cache:generation'
+MISSING = object()
+
+LOOKUPS = metrics.Counter(
+    'yatube_cache_lookups_total',
+    'Попадания и промахи двухуровневого кеша по уровням',
+)
+
+
+class SQLiteCache(BaseCache):
+    """Общий для процессов кеш в файле SQLite.
+
+    add() и incr() атомарны между процессами, поэтому на нём работают
+    блокировки core.cache.get_or_compute.
+    """
+    cull_every = 100
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+        self._sets = 0
+
+    def _connection(self):
+        # Соединение на поток; после fork открываем новое
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS cache_expires ON cache(expires)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._key(key, version), time.time()),
+        ).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        rows = self._connection().execute(
+            'SELECT key, value FROM cache WHERE key IN (%s) '
+            'AND (expires IS NULL OR expires > ?)' % ','.join('?' * len(keys)),
+            (*keys, time.time()),
+        )
+        return {keys[key]: pickle.loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) '
+            'VALUES (?, ?, ?)',
+            (
+                self._key(key, version),
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                self.get_backend_timeout(timeout),
+            ),
+        )
+        self._sets += 1
+        if self._sets % self.cull_every == 0:
+            self._cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, time.time()),
+            )
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                (
+                    key,
+                    pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                    self.get_backend_timeout(timeout),
+                ),
+            ).rowcount
+        finally:
+            connection.execute('COMMIT')
+        return bool(added)
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key),
+            )
+        finally:
+            connection.execute('COMMIT')
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return bool(self._connection().execute(
+            'UPDATE cache SET expires = ? WHERE key = ?',
+            (self.get_backend_timeout(timeout), self._key(key, version)),
+        ).rowcount)
+
+    def delete(self, key, version=None):
+        self._connection().execute(
+            'DELETE FROM cache WHERE key = ?', (self._key(key, version),))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def _cull(self):
+        connection = self._connection()
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count, = connection.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count > self._max_entries:
+            # Как у встроенных бэкендов: выбрасываем 1/CULL_FREQUENCY
+            # записей, ближайших к истечению
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,),
+            )
+
+
+class TieredCache(BaseCache):
+    """Процессный LRU (L1) перед общим кешем (L2).
+
+    LOCATION - алиас общего кеша в settings.CACHES. OPTIONS:
+    L1_MAX_ENTRIES, L1_TIMEOUT и COHERENCE_INTERVAL (в секундах).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = location
+        self._l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self._l1_timeout = float(options.get('L1_TIMEOUT', 5))
+        self._interval = float(options.get('COHERENCE_INTERVAL', 1))
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._checked = float('-inf')
+        self._stats = dict.fromkeys(
+            ('l1_hits', 'l1_misses', 'l2_hits', 'l2_misses'), 0)
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def stats(self):
+        """Попадания и промахи по уровням с момента старта процесса."""
+        with self._lock:
+            return dict(self._stats, l1_entries=len(self._local))
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+        for name, value in increments.items():
+            if value:
+                level, result = name.split('_')
+                LOOKUPS.inc(value, level=level, result=result)
+
+    # L1
+
+    def _remember(self, key, value, timeout=DEFAULT_TIMEOUT):
+        expires = time.monotonic() + self._l1_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            expires = min(expires, time.monotonic() + timeout)
+        # Храним копию, как LocMemCache: изменения объекта не попадут в кеш
+        entry = expires, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[key] = entry
+            self._local.move_to_end(key)
+            while len(self._local) > self._l1_max_entries:
+                self._local.popitem(last=False)
+
+    def _recall(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] <= time.monotonic():
+                del self._local[key]
+                return MISSING
+            self._local.move_to_end(key)
+        return pickle.loads(entry[1])
+
+    def _forget(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    # Согласованность
+
+    def _shared_generation(self):
+        generation = self.shared.get(GENERATION_KEY)
+        if generation is None:
+            self.shared.add(GENERATION_KEY, time.time(), timeout=None)
+            generation = self.shared.get(GENERATION_KEY)
+        return generation
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self._checked < self._interval:
+            return
+        generation = self._shared_generation()
+        with self._lock:
+            if generation != self._generation:
+                self._local.clear()
+                self._generation = generation
+            self._checked = now
+
+    def _bump(self):
+        try:
+            generation = self.shared.incr(GENERATION_KEY)
+        except ValueError:
+            generation = self._shared_generation()
+        with self._lock:
+            # Свой L1 уже согласован; если поколение сдвинул ещё кто-то,
+            # сбрасываем L1 целиком
+            if self._generation is None or generation != self._generation + 1:
+                self._local.clear()
+            self._generation = generation
+
+    # API кеша
+
+    def get(self, key, default=None, version=None):
+        self._sync()
+        local_key = self.make_key(key, version)
+        value = self._recall(local_key)
+        if value is not MISSING:
+            self._count(l1_hits=1)
+            return value
+        value = self.shared.get(key, MISSING, version=version)
+        if value is MISSING:
+            self._count(l1_misses=1, l2_misses=1)
+            return default
+        self._count(l1_misses=1, l2_hits=1)
+        self._remember(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        found, missing = {}, []
+        for key in keys:
+            value = self._recall(self.make_key(key, version))
+            if value is MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        shared = self.shared.get_many(missing, version=version)
+        for key, value in shared.items():
+            self._remember(self.make_key(key, version), value)
+        found.update(shared)
+        self._count(
+            l1_hits=len(keys) - len(missing),
+            l1_misses=len(missing),
+            l2_hits=len(shared),
+            l2_misses=len(missing) - len(shared),
+        )
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._remember(self.make_key(key, version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version) or []
+        for key, value in data.items():
+            if key not in failed:
+                self._remember(self.make_key(key, version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._remember(self.make_key(key, version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self._forget(self.make_key(key, version))
+        self._bump()
+        return value
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version=version)
+        self._forget(self.make_key(key, version))
+        self._bump()
+
+    def delete_many(self, keys, version=None):
+        self.shared.delete_many(keys, version=version)
+        self._forget(*(self.make_key(key, version) for key in keys))
+        self._bump()
+
+    def clear(self):
+        self.shared.clear()
+        with self._lock:
+            self._local.clear()
+            self._generation = None
+        self._checked = float('-inf')
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from core import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        'Складывает профили запросов в collapsed stacks для flame graph: '
+        'python manage.py profile_report | flamegraph.pl > profile.svg'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'views', nargs='*', metavar='VIEW',
+            help='Только эти view, например posts:index',
+        )
+        parser.add_argument(
+            '--token', action='store_true',
+            help='Вывести значение заголовка X-Profile и выйти',
+        )
+
+    def handle(self, *args, **options):
+        if options['token']:
+            self.stdout.write(profiling.make_token())
+            return
+        stacks, dumps = profiling.aggregate(options['views'])
+        for stack, count in sorted(stacks.items()):
+            self.stdout.write(f'{stack} {count}')
+        if options['verbosity'] > 0:
+            for view, count in sorted(dumps.items()):
+                self.stderr.write(f'{view}: запросов {count}')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет файлы метрик процессов. Запускать при перезапуске '
+        'приложения, пока его процессы остановлены'
+    )
+
+    def handle(self, *args, **options):
+        removed = metrics.reset()
+        self.stdout.write(f'Удалено файлов метрик: {removed}')
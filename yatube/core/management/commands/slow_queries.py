@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from core import slowlog
+
+# Сколько символов SQL показывать в сводке
+SQL_PREVIEW = 300
+
+
+class Command(BaseCommand):
+    help = 'Сводка по журналу медленных запросов: самые тяжёлые первыми'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=10,
+            help='Сколько запросов показать',
+        )
+        parser.add_argument(
+            '--sort', choices=['total', 'count', 'max'], default='total',
+            help='Суммарное время, число записей или самый долгий запрос',
+        )
+        parser.add_argument(
+            '--view',
+            help='Только запросы этой view, например posts:index',
+        )
+        parser.add_argument(
+            '--log', help='Файл журнала вместо SLOW_QUERY_LOG',
+        )
+
+    def handle(self, *args, **options):
+        entries = slowlog.read(options['log'])
+        if options['view']:
+            entries = (
+                entry for entry in entries
+                if entry['view'] == options['view']
+            )
+        offenders = slowlog.summarize(entries, options['sort'])
+        if not offenders:
+            self.stdout.write('Медленных запросов нет')
+            return
+        for place, offender in enumerate(
+                offenders[:options['top']], start=1):
+            self.stdout.write(
+                f'{place}. {offender["count"]} раз, '
+                f'всего {offender["total"]:.1f} мс, '
+                f'максимум {offender["max"]:.1f} мс '
+                f'[{offender["fingerprint"]}]'
+            )
+            for site in offender['call_sites']:
+                self.stdout.write(f'   {site}')
+            if offender['views']:
+                self.stdout.write(f'   view: {", ".join(offender["views"])}')
+            self.stdout.write(f'   {offender["sql"][:SQL_PREVIEW]}')
+            for step in offender['plan'] or ():
+                self.stdout.write(f'   план: {step}')
@@ -0,0 +1,177 @@
+"""Отдача файлов из MEDIA_ROOT в продакшене.
+
+Если перед Django стоит фронт-сервер, view только проверяет доступ, а
+сами байты передаёт сервер: nginx по заголовку X-Accel-Redirect
+(MEDIA_SENDFILE = 'x-accel-redirect', внутренний location с префиксом
+MEDIA_ACCEL_PREFIX), Apache mod_xsendfile или lighttpd по X-Sendfile
+(MEDIA_SENDFILE = 'x-sendfile').
+
+Без фронт-сервера файл отдаёт FileResponse: целиком - через
+wsgi.file_wrapper (сервер может использовать sendfile), а один
+диапазон из заголовка Range - ответом 206. Условные запросы проверяются
+по ETag и Last-Modified.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils._os import safe_join
+from django.utils.module_loading import import_string
+
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def is_public(request, name):
+    """Проверка доступа по умолчанию: скрытые и временные файлы закрыты.
+
+    Временные файлы оставляет запись в ContentAddressedStorage.
+    """
+    return not (
+        any(part.startswith('.') for part in name.split('/'))
+        or name.endswith('.tmp')
+    )
+
+
+def resolve(name):
+    """Путь к файлу в MEDIA_ROOT; 404, если его нет или он вне каталога."""
+    name = posixpath.normpath(name).lstrip('/')
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(path):
+        raise Http404
+    return name, path
+
+
+def make_etag(stat):
+    # Как у nginx: время изменения и размер, без чтения файла
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """(start, end) включительно для одного диапазона байт.
+
+    None - заголовка нет или он не поддерживается (несколько
+    диапазонов), тогда отдаётся весь файл. ValueError - диапазон не
+    пересекается с файлом.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # bytes=-N: последние N байт
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+class RangeFile:
+    """Файл, из которого читается только length байт от текущей позиции.
+
+    Нет fileno(), поэтому WSGI-сервер не отдаст через sendfile больше,
+    чем нужно.
+    """
+
+    def __init__(self, file_, length):
+        self.file = file_
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _range_matches(request, etag, last_modified):
+    # If-Range: диапазон отдаётся, только если файл не изменился
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified)
+
+
+def file_response(request, path, stat, content_type):
+    size = stat.st_size
+    etag = make_etag(stat)
+    headers = HttpResponse()
+    headers['ETag'] = etag
+    headers['Last-Modified'] = http_date(stat.st_mtime)
+    headers['Accept-Ranges'] = 'bytes'
+    conditional = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime),
+        response=headers,
+    )
+    if conditional is not headers:
+        return conditional
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and _range_matches(
+            request, etag, stat.st_mtime):
+        try:
+            byte_range = parse_range(request.META['HTTP_RANGE'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    file_ = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file_, content_type=content_type)
+    else:
+        start, end = byte_range
+        file_.seek(start)
+        response = FileResponse(
+            RangeFile(file_, end - start + 1), content_type=content_type,
+            status=206,
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    for header in ('ETag', 'Last-Modified', 'Accept-Ranges'):
+        response[header] = headers[header]
+    return response
+
+
+def sendfile_response(name, path, content_type):
+    """Пустой ответ, по которому файл отправит фронт-сервер."""
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_SENDFILE == X_ACCEL_REDIRECT:
+        response['X-Accel-Redirect'] = (
+            settings.MEDIA_ACCEL_PREFIX + quote(name))
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def serve(request, name):
+    """Проверяет доступ и отдаёт файл из MEDIA_ROOT."""
+    name, path = resolve(name)
+    if not import_string(settings.MEDIA_ACCESS_CHECK)(request, name):
+        # 404, а не 403: закрытый файл не должен выдавать своё
+        # существование
+        raise Http404
+    content_type = (
+        mimetypes.guess_type(name)[0] or 'application/octet-stream')
+    if settings.MEDIA_SENDFILE:
+        return sendfile_response(name, path, content_type)
+    return file_response(request, path, os.stat(path), content_type)
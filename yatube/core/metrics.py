@@ -0,0 +1,287 @@
+"""Метрики приложения: счётчики и гистограммы для Prometheus.
+
+Каждый процесс (воркер веб-сервера, процесс фонового пула) пишет свои
+значения в собственный файл METRICS_DIR/<pid>.db через mmap: запись -
+это изменение восьми байт в памяти, без блокировок между процессами.
+Эндпоинт /metrics читает файлы всех процессов, складывает значения и
+отдаёт их в текстовом формате Prometheus.
+
+Файлы завершившихся процессов не удаляются, иначе суммы счётчиков
+уменьшались бы. Само приложение каталог не чистит: при перезапуске
+целиком, пока процессы ещё не запущены, это делает команда
+reset_metrics. При METRICS_DIR = None метрики не собираются.
+
+Метрики объявляются на уровне модуля, где они меряются:
+
+    THUMBNAIL_SECONDS = metrics.Histogram(
+        'yatube_thumbnail_seconds', 'Время создания миниатюры')
+    with THUMBNAIL_SECONDS.time(format='JPEG'):
+        ...
+"""
+import bisect
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Границы корзин по умолчанию, секунды
+BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+REGISTRY = {}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _padding(length):
+    # Значение выравнивается на 8 байт: запись в него атомарна
+    return (8 - (4 + length) % 8) % 8
+
+
+def _entries(data, used):
+    """(ключ, значение, позиция значения) из содержимого файла."""
+    position = 8
+    while position < used:
+        length, = struct.unpack_from('i', data, position)
+        position += 4
+        key = bytes(data[position:position + length]).decode()
+        position += length + _padding(length)
+        value, = struct.unpack_from('d', data, position)
+        yield key, value, position
+        position += 8
+
+
+class ValueFile:
+    """Значения одного процесса в файле, отображённом в память.
+
+    Формат: 4 байта - занятая длина файла, 4 байта выравнивания, затем
+    записи: длина ключа, ключ, выравнивание, значение (double).
+    """
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        if not self._capacity:
+            self._capacity = self.INITIAL_SIZE
+            self._file.truncate(self._capacity)
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._used, = struct.unpack_from('i', self._map, 0)
+        if not self._used:
+            self._used = 8
+            struct.pack_into('i', self._map, 0, self._used)
+        self._positions = {
+            key: position
+            for key, _, position in _entries(self._map, self._used)
+        }
+
+    def _append(self, key):
+        encoded = key.encode()
+        entry = struct.pack(
+            f'i{len(encoded)}s{_padding(len(encoded))}xd',
+            len(encoded), encoded, 0.0,
+        )
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._map[self._used:self._used + len(entry)] = entry
+        # Читатели видят запись только после обновления длины
+        self._used += len(entry)
+        struct.pack_into('i', self._map, 0, self._used)
+        self._positions[key] = self._used - 8
+        return self._positions[key]
+
+    def add(self, key, amount):
+        with self._lock:
+            position = self._positions.get(key) or self._append(key)
+            value, = struct.unpack_from('d', self._map, position)
+            struct.pack_into('d', self._map, position, value + amount)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+def _value_file():
+    """Файл значений текущего процесса; None, если метрики выключены."""
+    directory = settings.METRICS_DIR
+    if directory is None:
+        return None
+    # pid в ключе: после fork у процесса должен быть свой файл
+    key = directory, os.getpid()
+    if key not in _files:
+        with _files_lock:
+            if key not in _files:
+                os.makedirs(directory, exist_ok=True)
+                _files[key] = ValueFile(
+                    os.path.join(directory, f'{os.getpid()}.db'))
+    return _files[key]
+
+
+def reset(directory=None):
+    """Удаляет файлы значений всех процессов; возвращает их число.
+
+    Только пока процессы приложения остановлены: работающий процесс
+    продолжит писать в удалённый файл, и его значения пропадут.
+    """
+    directory = directory or settings.METRICS_DIR
+    if directory is None:
+        return 0
+    paths = glob.glob(os.path.join(directory, '*.db'))
+    for path in paths:
+        os.remove(path)
+    return len(paths)
+
+
+def _key(name, suffix, labels):
+    return json.dumps([name, suffix, labels], sort_keys=True)
+
+
+def _add(name, suffix, labels, amount):
+    values = _value_file()
+    if values is not None:
+        values.add(_key(name, suffix, labels), amount)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        REGISTRY[name] = self
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        _add(self.name, '', labels, amount)
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными корзинами.
+
+    В файл пишется только корзина, куда попало значение; накопленные
+    суммы по le считаются при выводе.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != float('inf'):
+            self.buckets += (float('inf'),)
+
+    def observe(self, value, **labels):
+        bucket = self.buckets[bisect.bisect_left(self.buckets, value)]
+        _add(self.name, '_bucket', dict(labels, le=bucket), 1)
+        _add(self.name, '_sum', labels, value)
+        _add(self.name, '_count', labels, 1)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+def collect(directory=None):
+    """Сумма значений всех процессов: {(имя, суффикс, метки): значение}."""
+    directory = directory or settings.METRICS_DIR
+    totals = defaultdict(float)
+    if directory is None:
+        return totals
+    for path in glob.glob(os.path.join(directory, '*.db')):
+        with open(path, 'rb') as file_:
+            data = file_.read()
+        if len(data) < 8:
+            continue
+        used, = struct.unpack_from('i', data, 0)
+        for key, value, _ in _entries(data, min(used, len(data))):
+            name, suffix, labels = json.loads(key)
+            totals[name, suffix, tuple(sorted(labels.items()))] += value
+    return totals
+
+
+def _escape(value):
+    return (
+        str(value).replace('\\', r'\\').replace('\n', r'\n')
+        .replace('"', r'\"')
+    )
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _sample(name, labels, value):
+    if labels:
+        labels = ','.join(
+            f'{key}="{_escape(label)}"' for key, label in labels)
+        name = f'{name}{{{labels}}}'
+    return f'{name} {_format_value(value)}'
+
+
+def _histogram_lines(metric, samples):
+    # Корзины пишутся без накопления: накапливаем по возрастанию le
+    series = defaultdict(dict)
+    for (suffix, labels), value in samples.items():
+        if suffix == '_bucket':
+            labels = dict(labels)
+            le = labels.pop('le')
+            key = tuple(sorted(labels.items()))
+            series[key].setdefault('buckets', {})[le] = value
+        else:
+            series[labels][suffix] = value
+    for labels, values in sorted(series.items()):
+        total = 0
+        for bucket in metric.buckets:
+            total += values.get('buckets', {}).get(bucket, 0)
+            yield _sample(
+                f'{metric.name}_bucket',
+                labels + (('le', _format_value(bucket)),), total)
+        yield _sample(f'{metric.name}_sum', labels, values.get('_sum', 0))
+        yield _sample(
+            f'{metric.name}_count', labels, values.get('_count', 0))
+
+
+def render(directory=None):
+    """Метрики всех процессов в текстовом формате Prometheus.
+
+    Выводятся только метрики, объявленные в этом процессе.
+    """
+    by_metric = defaultdict(dict)
+    for (name, suffix, labels), value in collect(directory).items():
+        by_metric[name][suffix, labels] = value
+    lines = []
+    for name, metric in sorted(REGISTRY.items()):
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        samples = by_metric.get(name, {})
+        if metric.kind == 'histogram':
+            lines.extend(_histogram_lines(metric, samples))
+        else:
+            lines.extend(
+                _sample(name, labels, value)
+                for (_, labels), value in sorted(samples.items())
+            )
+    return '\n'.join(lines) + '\n'
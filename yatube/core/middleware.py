@@ -0,0 +1,140 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics, profiling, slowlog
+from .queries import budget_of, record
+
+logger = logging.getLogger(__name__)
+
+# Сколько самых частых повторов показывать в заголовке
+DUPLICATES_IN_HEADER = 5
+
+REQUEST_SECONDS = metrics.Histogram(
+    'yatube_request_seconds', 'Время ответа по view')
+REQUESTS = metrics.Counter(
+    'yatube_requests_total', 'Ответы по view и коду статуса')
+DB_QUERIES = metrics.Histogram(
+    'yatube_db_queries', 'Число запросов к базе за ответ',
+    buckets=(1, 2, 4, 6, 8, 12, 16, 24, 32, 64),
+)
+DB_SECONDS = metrics.Histogram(
+    'yatube_db_seconds', 'Время запросов к базе за ответ')
+
+
+class QueryBudgetMiddleware:
+    """Считает запросы к базе за запрос и сверяет их с бюджетом view.
+
+    При QUERY_BUDGET_HEADERS число запросов, время в базе и повторы
+    отдаются в заголовках X-Query-*. Превышение бюджета пишется в лог.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with record() as recorder:
+            response = self.get_response(request)
+        match = request.resolver_match
+        budget = budget_of(match.func) if match else None
+        if budget is not None and recorder.count > budget:
+            logger.warning(
+                '%s: %s запросов при бюджете %s, повторы: %s',
+                request.path, recorder.count, budget,
+                recorder.duplicates()[:DUPLICATES_IN_HEADER],
+            )
+        if settings.QUERY_BUDGET_HEADERS:
+            response['X-Query-Count'] = recorder.count
+            response['X-Query-Time'] = f'{recorder.duration * 1000:.1f}ms'
+            duplicates = recorder.duplicates()[:DUPLICATES_IN_HEADER]
+            if duplicates:
+                response['X-Query-Duplicates'] = ', '.join(
+                    f'{key}*{count}' for key, count in duplicates)
+            if budget is not None:
+                response['X-Query-Budget'] = budget
+        return response
+
+
+class SlowQueryMiddleware:
+    """Пишет в журнал запросы к базе дольше SLOW_QUERY_THRESHOLD мс."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with slowlog.watch(request):
+            return self.get_response(request)
+
+
+class MetricsMiddleware:
+    """Время ответа, код статуса и работа с базой по каждой view.
+
+    Запросы, не попавшие ни в одну view, идут под именем 'unresolved':
+    путь в метку не пишется, иначе число рядов метрики не ограничено.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with record() as recorder:
+            response = self.get_response(request)
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, view=view)
+        REQUESTS.inc(view=view, status=response.status_code)
+        DB_QUERIES.observe(recorder.count, view=view)
+        DB_SECONDS.observe(recorder.duration, view=view)
+        return response
+
+
+class ProfilingMiddleware:
+    """Профилирует выбранные запросы, см. core.profiling.
+
+    Стоит после AuthenticationMiddleware: флаг ?profile=1 работает
+    только для сотрудников.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.should_profile(request):
+            return self.get_response(request)
+        with profiling.Sampler(settings.PROFILE_INTERVAL) as sampler:
+            response = self.get_response(request)
+        match = request.resolver_match
+        profiling.dump(match.view_name if match else 'unresolved',
+                       sampler.stacks)
+        return response
+
+
+class TemplateTimingMiddleware:
+    """Сводка по времени отрисовки узлов шаблонов, см. core.template_timing.
+
+    При выключенном TEMPLATE_TIMING не подключается вовсе.
+    """
+
+    def __init__(self, get_response):
+        if not settings.TEMPLATE_TIMING:
+            raise MiddlewareNotUsed
+        # Импорт здесь: без TEMPLATE_TIMING модуль не нужен
+        from . import template_timing
+        self.timing = template_timing
+        self.timing.install()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        self.timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = self.timing.stop()
+        if timings.entries:
+            response['Server-Timing'] = self.timing.server_timing(timings)
+            response['X-Template-Time'] = f'{timings.total * 1000:.1f}ms'
+            self.timing.log(request, timings)
+        return response
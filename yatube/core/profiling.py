@@ -0,0 +1,149 @@
+"""Профилирование отдельных запросов семплированием стека.
+
+Пока идёт запрос, фоновый поток каждые PROFILE_INTERVAL секунд снимает
+стек потока запроса (sys._current_frames) и считает одинаковые стеки.
+Накладные расходы не зависят от числа вызовов функций, как у cProfile,
+а стеки получаются целиком - то, что нужно для flame graph.
+
+Профилируется запрос, если:
+- в заголовке X-Profile передан подписанный токен (make_token);
+- сотрудник добавил к адресу ?profile=1;
+- он попал в случайную выборку PROFILE_SAMPLE_RATE.
+
+Результат пишется в PROFILE_DIR/<view>/ в формате collapsed stacks
+("кадр;кадр;кадр число"), команда profile_report складывает их по view.
+"""
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import quote, unquote
+
+from django.conf import settings
+from django.core import signing
+
+SALT = 'core.profiling'
+TOKEN_VALUE = 'profile'
+
+
+def make_token():
+    """Значение заголовка X-Profile, действующее PROFILE_TOKEN_MAX_AGE."""
+    return signing.TimestampSigner(salt=SALT).sign(TOKEN_VALUE)
+
+
+def _valid_token(token):
+    try:
+        value = signing.TimestampSigner(salt=SALT).unsign(
+            token, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return value == TOKEN_VALUE
+
+
+def should_profile(request):
+    token = request.META.get('HTTP_X_PROFILE')
+    if token and _valid_token(token):
+        return True
+    if request.GET.get('profile') and request.user.is_staff:
+        return True
+    rate = settings.PROFILE_SAMPLE_RATE
+    return bool(rate) and random.random() < rate
+
+
+def _label(code):
+    path = code.co_filename
+    if path.startswith(settings.BASE_DIR):
+        path = os.path.relpath(path, settings.BASE_DIR)
+    elif 'site-packages' in path:
+        path = path.split('site-packages', 1)[1].lstrip(os.sep)
+    # Пробел и ";" - разделители формата collapsed stacks
+    return f'{path}:{code.co_name}'.replace(' ', '_').replace(';', '_')
+
+
+def collapse(frame, root=None):
+    """Стек от корня к кадру одной строкой; кадры выше root отбрасываются."""
+    labels = []
+    while frame is not None and frame is not root:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class Sampler:
+    """Семплирует стек текущего потока, пока открыт блок with."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        # Кадр, открывший блок: всё, что выше, к запросу не относится
+        self._root = sys._getframe(1)
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._sampler.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                stack = collapse(frame, self._root)
+                if stack:
+                    self.stacks[stack] += 1
+
+
+def _view_dir(view):
+    # ':' в именах каталогов допустим не везде
+    return os.path.join(settings.PROFILE_DIR, quote(view, safe=''))
+
+
+def dump(view, stacks):
+    """Сохраняет стеки запроса; возвращает путь к файлу."""
+    directory = _view_dir(view)
+    os.makedirs(directory, exist_ok=True)
+    name = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}.txt'
+    path = os.path.join(directory, name)
+    with open(path, 'w', encoding='utf-8') as file_:
+        for stack, count in stacks.most_common():
+            file_.write(f'{stack} {count}\n')
+    return path
+
+
+def read_dump(path):
+    stacks = Counter()
+    with open(path, encoding='utf-8') as file_:
+        for line in file_:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack and count.isdigit():
+                stacks[stack] += int(count)
+    return stacks
+
+
+def aggregate(views=None):
+    """Стеки всех дампов с именем view в корне и число дампов по view.
+
+    views - имена view (posts:index), которыми ограничить отчёт.
+    """
+    stacks = Counter()
+    dumps = Counter()
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return stacks, dumps
+    for directory in sorted(os.listdir(settings.PROFILE_DIR)):
+        view = unquote(directory)
+        if views and view not in views:
+            continue
+        path = os.path.join(settings.PROFILE_DIR, directory)
+        for name in sorted(os.listdir(path)):
+            dumps[view] += 1
+            for stack, count in read_dump(os.path.join(path, name)).items():
+                stacks[f'{view};{stack}'] += count
+    return stacks, dumps
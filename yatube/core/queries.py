@@ -0,0 +1,78 @@
+"""Учёт SQL-запросов запроса: число, время и повторы.
+
+QueryRecorder подключается к соединениям через execute_wrapper и
+работает без DEBUG. Повторы считаются по отпечатку запроса: SQL без
+параметров, со свёрнутыми списками IN (%s, %s, ...). Один и тот же
+отпечаток много раз за запрос - обычно N+1 в цикле шаблона.
+
+View объявляет свой бюджет декоратором @query_budget(n); его проверяют
+QueryBudgetMiddleware (пишет предупреждение в лог) и тесты через
+core.testing.QueryBudgetMixin.
+"""
+import hashlib
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Короткий отпечаток запроса без учёта значений параметров."""
+    sql = SPACE_RE.sub(' ', IN_LIST_RE.sub('IN (...)', sql)).strip()
+    return hashlib.md5(sql.encode()).hexdigest()[:8]
+
+
+class QueryRecorder:
+    """execute_wrapper, запоминающий время и отпечатки запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            self.statements.setdefault(key, sql)
+
+    def duplicates(self):
+        """Отпечатки, выполненные больше одного раза, от частых к редким."""
+        return [
+            (key, count)
+            for key, count in self.fingerprints.most_common()
+            if count > 1
+        ]
+
+
+@contextmanager
+def record():
+    """Записывает запросы ко всем базам внутри блока."""
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def query_budget(limit):
+    """Объявляет, сколько запросов к базе может сделать view."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def budget_of(view):
+    return getattr(view, 'query_budget', None)
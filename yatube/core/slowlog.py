@@ -0,0 +1,240 @@
+"""Журнал медленных запросов к базе.
+
+SlowQueryLogger подключается к соединениям через execute_wrapper и
+записывает запросы дольше SLOW_QUERY_THRESHOLD миллисекунд: SQL, форму
+параметров (типы, без значений), строку нашего кода, откуда пришёл
+запрос, имя view и план запроса. Записи - по одной JSON-строке - идут
+в файл процесса рядом с SLOW_QUERY_LOG (slow_queries.<pid>.log),
+который ротируется по размеру. Общий файл на все процессы ротировать
+нельзя: остальные продолжали бы писать в переименованный файл и
+затирали бы копии своей ротацией. read() сливает файлы всех процессов.
+
+Сводку по журналу печатает команда slow_queries.
+"""
+import glob
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from itertools import groupby
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.db import DatabaseError, NotSupportedError, connections
+from django.utils import timezone
+
+from . import queries
+from .queries import fingerprint
+
+# Кадры самих execute_wrapper-ов местом вызова не считаются
+WRAPPER_FILES = {__file__, queries.__file__}
+
+_handlers = {}
+
+
+def _process_path(path, pid):
+    root, extension = os.path.splitext(path)
+    return f'{root}.{pid}{extension}'
+
+
+def _handler():
+    # pid в ключе: после fork у процесса должен быть свой файл
+    key = (
+        settings.SLOW_QUERY_LOG,
+        settings.SLOW_QUERY_LOG_MAX_BYTES,
+        settings.SLOW_QUERY_LOG_BACKUPS,
+        os.getpid(),
+    )
+    if key not in _handlers:
+        path, max_bytes, backups, pid = key
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _handlers[key] = RotatingFileHandler(
+            _process_path(path, pid), maxBytes=max_bytes,
+            backupCount=backups, encoding='utf-8', delay=True,
+        )
+    return _handlers[key]
+
+
+def write(entry):
+    line = json.dumps(entry, ensure_ascii=False)
+    _handler().handle(logging.makeLogRecord({'msg': line}))
+
+
+def call_site():
+    """Ближайшая к запросу строка нашего кода: 'posts/views.py:53 in index'.
+
+    Кадры Django, библиотек и execute_wrapper-ов пропускаются. Если запрос
+    выполнил шаблон, это строка, где view вызвала render().
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (
+            filename.startswith(settings.BASE_DIR)
+            and 'site-packages' not in filename
+            and filename not in WRAPPER_FILES
+        ):
+            path = os.path.relpath(filename, settings.BASE_DIR)
+            return f'{path}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+def _types(values):
+    names = [type(value).__name__ for value in values]
+    return ', '.join(
+        name if count == 1 else f'{name}*{count}'
+        for name, count in (
+            (name, len(list(run))) for name, run in groupby(names))
+    )
+
+
+def params_shape(params, many=False):
+    """Типы параметров без значений: '(int, str*2)'.
+
+    Для executemany - число наборов и форма первого: '3x(int, str)'.
+    """
+    if many:
+        params = list(params)
+        first = params_shape(params[0]) if params else '()'
+        return f'{len(params)}x{first}'
+    if params is None:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(
+            f'{key}: {type(value).__name__}'
+            for key, value in sorted(params.items())
+        ) + '}'
+    return f'({_types(params)})'
+
+
+def explain(connection, sql, params):
+    """План SELECT-запроса строками; для остальных запросов - None.
+
+    План берётся через сырой курсор, чтобы не пройти снова через
+    execute_wrapper и не попасть в учёт запросов.
+    """
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    try:
+        prefix = connection.ops.explain_query_prefix()
+        with connection.cursor() as cursor:
+            cursor.cursor.execute(f'{prefix} {sql}', params)
+            rows = cursor.cursor.fetchall()
+    except (DatabaseError, NotSupportedError) as error:
+        return [f'не удалось получить план: {error}']
+    if connection.vendor == 'sqlite':
+        # id, parent, notused, detail
+        return [row[-1] for row in rows]
+    return [' '.join(str(column) for column in row) for row in rows]
+
+
+class SlowQueryLogger:
+    """execute_wrapper, пишущий в журнал запросы дольше порога."""
+
+    def __init__(self, threshold, request=None):
+        self.threshold = threshold
+        self.request = request
+
+    def view_name(self):
+        if self.request is None:
+            return None
+        match = getattr(self.request, 'resolver_match', None)
+        return match.view_name if match else self.request.path
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - started) * 1000
+        if duration >= self.threshold:
+            write({
+                'time': timezone.now().isoformat(),
+                'duration': round(duration, 1),
+                'fingerprint': fingerprint(sql),
+                'sql': sql,
+                'params': params_shape(params, many),
+                'call_site': call_site(),
+                'view': self.view_name(),
+                'plan': None if many else explain(
+                    context['connection'], sql, params),
+            })
+        return result
+
+
+@contextmanager
+def watch(request=None):
+    """Пишет в журнал медленные запросы ко всем базам внутри блока."""
+    threshold = settings.SLOW_QUERY_THRESHOLD
+    with ExitStack() as stack:
+        if threshold is not None:
+            logger = SlowQueryLogger(threshold, request)
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(logger))
+        yield
+
+
+def _log_files(path):
+    """Сам path и файлы процессов рядом с ним: slow_queries.<pid>.log."""
+    root, extension = os.path.splitext(path)
+    own = re.compile(re.escape(root) + r'\.\d+' + re.escape(extension))
+    names = glob.glob(f'{glob.escape(root)}.*{extension}')
+    return [path] + sorted(name for name in names if own.fullmatch(name))
+
+
+def read(path=None, backups=None):
+    """Записи журналов всех процессов с ротированными файлами, по времени.
+
+    Оборванные строки (процесс упал посреди записи) пропускаются.
+    """
+    path = path or settings.SLOW_QUERY_LOG
+    if backups is None:
+        backups = settings.SLOW_QUERY_LOG_BACKUPS
+    entries = []
+    for log in _log_files(path):
+        paths = [f'{log}.{index}' for index in range(backups, 0, -1)]
+        paths.append(log)
+        for name in paths:
+            if not os.path.exists(name):
+                continue
+            with open(name, encoding='utf-8') as file_:
+                for line in file_:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+    # Время в UTC и ISO-формате: строки сравниваются как даты
+    entries.sort(key=lambda entry: entry.get('time', ''))
+    return entries
+
+
+def summarize(entries, order='total'):
+    """Сводка по отпечаткам запросов, самые тяжёлые первыми.
+
+    order: 'total' - суммарное время, 'count' - число записей,
+    'max' - самый долгий запрос.
+    """
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[entry['fingerprint']].append(entry)
+    offenders = []
+    for key, items in groups.items():
+        durations = [item['duration'] for item in items]
+        slowest = max(items, key=lambda item: item['duration'])
+        offenders.append({
+            'fingerprint': key,
+            'count': len(items),
+            'total': sum(durations),
+            'max': max(durations),
+            'sql': slowest['sql'],
+            'plan': slowest['plan'],
+            'call_sites': sorted({item['call_site'] for item in items
+                                  if item['call_site']}),
+            'views': sorted({item['view'] for item in items
+                             if item['view']}),
+        })
+    offenders.sort(key=lambda offender: offender[order], reverse=True)
+    return offenders
@@ -0,0 +1,56 @@
+"""Хранилище, в котором имя файла - хеш его содержимого.
+
+Одинаковые загрузки получают одно имя и хранятся один раз, а миниатюры
+sorl-thumbnail, ключи которых строятся по имени исходника, становятся
+общими для всех постов с этой картинкой. Удалять такой файл при
+удалении поста нельзя: на него могут ссылаться другие посты.
+"""
+import hashlib
+import os
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+CHUNK_SIZE = 64 * 1024
+# Одно расширение для одного формата, чтобы не плодить копии
+EXTENSIONS = {'.jpeg': '.jpg', '.jpe': '.jpg'}
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы лежат в <каталог>/ab/cd/<sha256><расширение>."""
+
+    def hashed_name(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        extension = EXTENSIONS.get(extension, extension)
+        digest = content_hash(content)
+        return os.path.join(
+            directory, digest[:2], digest[2:4], digest + extension
+        ).replace('\\', '/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        # Пишем под временным именем и атомарно переименовываем: если тот
+        # же файл одновременно сохраняет другой процесс, содержимое
+        # у них одинаковое и перезапись ничего не портит
+        temporary = self._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
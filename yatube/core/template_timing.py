@@ -0,0 +1,142 @@
+"""Время отрисовки шаблонов по узлам: include, block, кеш, миниатюры.
+
+Включается настройкой TEMPLATE_TIMING. Тогда TemplateTimingMiddleware
+при запуске подменяет render у классов узлов из NODE_CLASSES, а на
+время запроса заводит сборщик. Выключенная настройка ничего не стоит:
+middleware не подключается, а классы узлов остаются нетронутыми.
+
+Для каждой метки ("include includes/article.html", "block content")
+считаются число отрисовок, полное время и собственное время - без
+вложенных измеряемых узлов. Сводка уходит в заголовки Server-Timing и
+X-Template-Time и в лог core.template_timing (уровень INFO).
+"""
+import logging
+import threading
+import time
+from functools import wraps
+
+from django.template.loader_tags import BlockNode, IncludeNode
+from django.template.library import InclusionNode
+from django.templatetags.cache import CacheNode
+from sorl.thumbnail.templatetags.thumbnail import ThumbnailNode
+
+from .templatetags.fragments import FragmentCacheNode
+
+logger = logging.getLogger(__name__)
+
+# Сколько самых долгих меток попадает в заголовок Server-Timing
+HEADER_ENTRIES = 10
+
+
+def _include_label(node):
+    return f'include {getattr(node.template, "var", node.template)}'
+
+
+NODE_CLASSES = {
+    IncludeNode: _include_label,
+    BlockNode: lambda node: f'block {node.name}',
+    CacheNode: lambda node: f'cache {node.fragment_name}',
+    FragmentCacheNode: lambda node: f'fragment_cache {node.fragment_name}',
+    # post_picture и другие теги с собственным шаблоном
+    InclusionNode: lambda node: f'tag {node.func.__name__}',
+    ThumbnailNode: lambda node: 'thumbnail',
+}
+
+_state = threading.local()
+_originals = {}
+
+
+class Timings:
+    """Время узлов одного запроса."""
+
+    def __init__(self):
+        self.total = 0.0
+        # label -> [число, полное время, собственное время]
+        self.entries = {}
+        self._children = []
+
+    def measure(self, label, render, node, context):
+        self._children.append(0.0)
+        started = time.perf_counter()
+        try:
+            return render(node, context)
+        finally:
+            duration = time.perf_counter() - started
+            children = self._children.pop()
+            if self._children:
+                self._children[-1] += duration
+            else:
+                self.total += duration
+            entry = self.entries.setdefault(label, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+            entry[2] += duration - children
+
+    def by_own_time(self):
+        return sorted(
+            self.entries.items(), key=lambda item: item[1][2], reverse=True)
+
+
+def _timed(render, label):
+    @wraps(render)
+    def timed_render(node, context):
+        timings = getattr(_state, 'timings', None)
+        if timings is None:
+            return render(node, context)
+        return timings.measure(label(node), render, node, context)
+    return timed_render
+
+
+def install():
+    """Подменяет render у измеряемых узлов; повторно ничего не делает."""
+    for node_class, label in NODE_CLASSES.items():
+        if node_class in _originals:
+            continue
+        _originals[node_class] = node_class.__dict__.get('render')
+        node_class.render = _timed(node_class.render, label)
+
+
+def uninstall():
+    for node_class, render in _originals.items():
+        if render is None:
+            del node_class.render
+        else:
+            node_class.render = render
+    _originals.clear()
+
+
+def start():
+    _state.timings = Timings()
+
+
+def stop():
+    timings, _state.timings = getattr(_state, 'timings', None), None
+    return timings
+
+
+def _ms(seconds):
+    return f'{seconds * 1000:.1f}'
+
+
+def server_timing(timings):
+    """Значение заголовка Server-Timing: общее время и самые долгие метки."""
+    metrics = [f'template;dur={_ms(timings.total)}']
+    for index, (label, (count, total, own)) in enumerate(
+            timings.by_own_time()[:HEADER_ENTRIES]):
+        description = f'{label} x{count}'.replace('"', "'")
+        metrics.append(
+            f'tpl{index};desc="{description}";dur={_ms(own)}')
+    return ', '.join(metrics)
+
+
+def log(request, timings):
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    lines = [
+        f'{count:>5} {_ms(total):>8} {_ms(own):>8}  {label}'
+        for label, (count, total, own) in timings.by_own_time()
+    ]
+    logger.info(
+        'Шаблоны %s: %s мс\n  раз   всего  своё мс\n%s',
+        request.path, _ms(timings.total), '\n'.join(lines),
+    )
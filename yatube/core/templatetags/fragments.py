@@ -0,0 +1,62 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from core.cache import get_or_compute, get_version
+
+register = template.Library()
+
+
+@register.simple_tag
+def cache_version(*parts):
+    """Версия данных для ключа {% fragment_cache %}.
+
+    Имя области и следующий за ним id склеиваются:
+    {% cache_version 'post' post.pk 'author' post.author_id as version %}
+    Область с id None (пост без группы) пропускается.
+    """
+    scopes = []
+    for part in parts:
+        if isinstance(part, str) and not part.isdigit():
+            scopes.append(part)
+        elif part is None:
+            scopes.pop()
+        else:
+            scopes[-1] = f'{scopes[-1]}:{part}'
+    return get_version(*scopes)
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        timeout = int(self.timeout.resolve(context))
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        return get_or_compute(
+            key, lambda: self.nodelist.render(context), timeout,
+            name=self.fragment_name,
+        )
+
+
+@register.tag
+def fragment_cache(parser, token):
+    """Как {% cache %}, но без давки при истечении фрагмента.
+
+    {% fragment_cache 600 name var1 var2 %} ... {% endfragment_cache %}
+    """
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]} принимает как минимум два аргумента.')
+    return FragmentCacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],
+        [parser.compile_filter(token) for token in tokens[3:]],
+    )
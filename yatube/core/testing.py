@@ -0,0 +1,69 @@
+import copy
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from django.urls import resolve
+
+from .queries import budget_of, record
+
+CACHE_DIR_VARIABLE = 'YATUBE_CACHE_DIR'
+METRICS_DIR_VARIABLE = 'YATUBE_METRICS_DIR'
+
+
+class TestRunner(DiscoverRunner):
+    """Тесты с общим кешем и метриками во временном каталоге.
+
+    Иначе тесты чистили бы рабочий cache.sqlite3, оставшиеся в нём
+    ключи переходили бы из одного запуска в другой, а метрики тестовых
+    запросов попадали бы в рабочий /metrics.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.temp_dir = tempfile.mkdtemp()
+        metrics_dir = os.path.join(self.temp_dir, 'metrics')
+        # Процессы фонового пула читают настройки заново
+        os.environ[CACHE_DIR_VARIABLE] = self.temp_dir
+        os.environ[METRICS_DIR_VARIABLE] = metrics_dir
+        caches = copy.deepcopy(settings.CACHES)
+        for config in caches.values():
+            if config['BACKEND'] == 'core.cache_backends.SQLiteCache':
+                config['LOCATION'] = os.path.join(
+                    self.temp_dir, os.path.basename(config['LOCATION']))
+        self.overrides = override_settings(
+            CACHES=caches, METRICS_DIR=metrics_dir)
+        self.overrides.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.overrides.disable()
+        os.environ.pop(CACHE_DIR_VARIABLE, None)
+        os.environ.pop(METRICS_DIR_VARIABLE, None)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetMixin:
+    """Проверка, что view укладывается в объявленный бюджет запросов."""
+
+    def assertWithinQueryBudget(self, url, client=None, data=None):
+        view = resolve(url.split('?')[0]).func
+        budget = budget_of(view)
+        if budget is None:
+            self.fail(f'У view для {url} не объявлен @query_budget')
+        client = client or self.client
+        with record() as recorder:
+            response = client.get(url, data)
+        if recorder.count > budget:
+            details = '\n'.join(
+                f'{count} x {recorder.statements[key]}'
+                for key, count in recorder.duplicates()
+            )
+            self.fail(
+                f'{url}: {recorder.count} запросов при бюджете {budget}.'
+                f'\nПовторы:\n{details or "нет"}'
+            )
+        return response
@@ -0,0 +1,126 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import SimpleTestCase
+
+from ..cache import (
+    LOCK_KEY, _locks, bump, get_or_compute, get_validators, get_version,
+)
+
+
+class CacheVersionTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_changes_version(self):
+        """Версия меняется только у затронутой области."""
+        post_version = get_version('post:1')
+        other_version = get_version('post:2')
+        bump('post:1')
+        self.assertNotEqual(get_version('post:1'), post_version)
+        self.assertEqual(get_version('post:2'), other_version)
+
+    def test_lost_version_is_not_reused(self):
+        """Вытесненная версия не возвращается к старому значению."""
+        version = get_version('post:1')
+        cache.clear()
+        time.sleep(0.002)
+        self.assertNotEqual(get_version('post:1'), version)
+
+    def test_validators(self):
+        """Время изменения растёт вместе с версией."""
+        version, modified = get_validators('post:1')
+        self.assertIsNotNone(modified)
+        time.sleep(0.002)
+        bump('post:1')
+        new_version, new_modified = get_validators('post:1')
+        self.assertNotEqual(new_version, version)
+        self.assertGreater(new_modified, modified)
+
+
+class StampedeTests(SimpleTestCase):
+    workers = 8
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def compute(self):
+        with self.calls_lock:
+            self.calls += 1
+        time.sleep(0.2)
+        return f'значение {self.calls}'
+
+    def run_concurrently(self, **kwargs):
+        barrier = threading.Barrier(self.workers)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(
+                get_or_compute('hot', self.compute, **kwargs))
+
+        threads = [
+            threading.Thread(target=worker) for _ in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_cold_key_is_computed_once(self):
+        """Пустой ключ считает один поток, остальные ждут результат."""
+        results = self.run_concurrently(timeout=60)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(set(results), {'значение 1'})
+
+    def test_expired_key_is_recomputed_once(self):
+        """После истечения пересчитывает один поток, остальные отдают
+        устаревшее значение."""
+        # Запись живёт вдвое дольше срока: от 0.5 до 1 секунды после
+        # пересчёта потоки должны застать устаревшее значение
+        get_or_compute('hot', self.compute, timeout=0.5, beta=0)
+        time.sleep(0.6)
+        results = self.run_concurrently(timeout=0.5, beta=0)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(
+            sorted(results), ['значение 1'] * (self.workers - 1)
+            + ['значение 2'])
+
+    def test_lock_released_after_store(self):
+        """Пока значение не записано, блокировка пересчёта держится."""
+        held = []
+        set_value = cache.set
+
+        def recording_set(key, *args, **kwargs):
+            held.append(_locks().get(LOCK_KEY.format('hot')) is not None)
+            return set_value(key, *args, **kwargs)
+
+        with mock.patch.object(cache, 'set', recording_set):
+            get_or_compute('hot', lambda: 'значение', timeout=60)
+        self.assertEqual(held, [True])
+        self.assertIsNone(_locks().get(LOCK_KEY.format('hot')))
+
+    def test_lock_released_on_error(self):
+        def fail():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            get_or_compute('hot', fail, timeout=60)
+        self.assertIsNone(_locks().get(LOCK_KEY.format('hot')))
+
+    def test_fragment_cache_tag(self):
+        """Тег fragment_cache кеширует отрисованный фрагмент."""
+        template = Template(
+            '{% load fragments %}'
+            '{% fragment_cache 60 test_fragment key %}{{ value }}'
+            '{% endfragment_cache %}'
+        )
+        first = template.render(Context({'key': 1, 'value': 'старое'}))
+        second = template.render(Context({'key': 1, 'value': 'новое'}))
+        self.assertEqual(first, second)
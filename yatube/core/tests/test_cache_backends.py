@@ -0,0 +1,94 @@
+import os
+import tempfile
+import threading
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from ..cache_backends import SQLiteCache, TieredCache
+
+LOCATION = os.path.join(tempfile.mkdtemp(), 'cache.sqlite3')
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': LOCATION,
+    },
+})
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['shared'].clear()
+
+    def make_tiered(self, **options):
+        """Отдельный экземпляр имитирует отдельный процесс."""
+        options.setdefault('COHERENCE_INTERVAL', 0)
+        return TieredCache('shared', {'OPTIONS': options})
+
+    def test_hits_and_misses_per_tier(self):
+        """Статистика считает попадания на каждом уровне."""
+        first, second = self.make_tiered(), self.make_tiered()
+        self.assertIsNone(first.get('key'))
+        first.set('key', 'значение')
+        self.assertEqual(first.get('key'), 'значение')
+        self.assertEqual(second.get('key'), 'значение')
+        self.assertEqual(second.get('key'), 'значение')
+        self.assertEqual(first.stats()['l2_misses'], 1)
+        self.assertEqual(first.stats()['l1_hits'], 1)
+        self.assertEqual(second.stats()['l2_hits'], 1)
+        self.assertEqual(second.stats()['l1_hits'], 1)
+
+    def test_invalidation_reaches_other_processes(self):
+        """Удаление и incr в одном процессе видны в другом."""
+        first, second = self.make_tiered(), self.make_tiered()
+        first.set('key', 'значение')
+        first.set('version', 1)
+        second.get('key')
+        second.get('version')
+        first.delete('key')
+        first.incr('version')
+        self.assertIsNone(second.get('key'))
+        self.assertEqual(second.get('version'), 2)
+
+    def test_local_tier_is_bounded(self):
+        """L1 вытесняет давно не читанные ключи."""
+        cache = self.make_tiered(L1_MAX_ENTRIES=2)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        self.assertEqual(cache.stats()['l1_entries'], 2)
+        cache.get('a')
+        self.assertEqual(cache.stats()['l2_hits'], 1)
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = SQLiteCache(LOCATION, {})
+        self.cache.clear()
+
+    def test_add_is_atomic(self):
+        """Из одновременных add() успешен ровно один."""
+        barrier = threading.Barrier(8)
+        results = []
+
+        def worker():
+            cache = SQLiteCache(LOCATION, {})
+            barrier.wait()
+            results.append(cache.add('lock', 1))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
+
+    def test_expiry_and_incr(self):
+        self.cache.set('gone', 1, timeout=-1)
+        self.assertIsNone(self.cache.get('gone'))
+        self.assertTrue(self.cache.add('gone', 2))
+        self.assertEqual(self.cache.incr('gone', 3), 5)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
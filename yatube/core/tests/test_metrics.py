@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from .. import metrics
+
+User = get_user_model()
+
+REQUESTS = metrics.Counter('test_requests_total', 'Тестовый счётчик')
+LATENCY = metrics.Histogram(
+    'test_latency_seconds', 'Тестовая гистограмма', buckets=(0.1, 1))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.mkdtemp()
+        override = override_settings(METRICS_DIR=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def tearDown(self):
+        for values in metrics._files.values():
+            values.close()
+        metrics._files.clear()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_render(self):
+        REQUESTS.inc(view='a"b')
+        REQUESTS.inc(2, view='a"b')
+        LATENCY.observe(0.05)
+        LATENCY.observe(0.5)
+        LATENCY.observe(5)
+        text = metrics.render()
+        self.assertIn('# TYPE test_requests_total counter', text)
+        self.assertIn('test_requests_total{view="a\\"b"} 3.0', text)
+        self.assertIn('test_latency_seconds_bucket{le="0.1"} 1.0', text)
+        self.assertIn('test_latency_seconds_bucket{le="1.0"} 2.0', text)
+        self.assertIn('test_latency_seconds_bucket{le="+Inf"} 3.0', text)
+        self.assertIn('test_latency_seconds_count 3.0', text)
+        self.assertIn('test_latency_seconds_sum 5.55', text)
+
+    def test_processes_are_summed(self):
+        REQUESTS.inc(view='x')
+        # Файл другого процесса
+        other = metrics.ValueFile(f'{self.root}/1.db')
+        other.add(metrics._key('test_requests_total', '', {'view': 'x'}), 4)
+        other.close()
+        self.assertIn('test_requests_total{view="x"} 5.0', metrics.render())
+
+    def test_file_grows(self):
+        values = metrics.ValueFile(f'{self.root}/2.db')
+        count = metrics.ValueFile.INITIAL_SIZE // 16
+        for index in range(count):
+            values.add(f'key-{index}', index)
+        values.close()
+        values = metrics.ValueFile(f'{self.root}/2.db')
+        self.assertEqual(len(values._positions), count)
+        values.close()
+
+    def test_reset_command(self):
+        other = metrics.ValueFile(f'{self.root}/1.db')
+        other.add(metrics._key('test_requests_total', '', {'view': 'x'}), 4)
+        other.close()
+        out = StringIO()
+        call_command('reset_metrics', stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.assertEqual(os.listdir(self.root), [])
+        self.assertNotIn('test_requests_total{', metrics.render())
+
+    @override_settings(METRICS_DIR=None)
+    def test_disabled(self):
+        REQUESTS.inc(view='x')
+        self.assertNotIn('test_requests_total{', metrics.render())
+
+    def test_endpoint_access(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(METRICS_TOKEN='secret'):
+            response = self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(response.status_code, 403)
+            response = self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_views_and_cache_are_instrumented(self):
+        self.client.get('/')
+        self.client.get('/')
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        text = self.client.get('/metrics').content.decode()
+        self.assertIn(
+            'yatube_request_seconds_count{view="posts:index"} 2.0', text)
+        self.assertIn(
+            'yatube_requests_total{status="200",view="posts:index"} 2.0',
+            text)
+        self.assertIn(
+            'yatube_db_queries_count{view="posts:index"} 2.0', text)
+        self.assertIn(
+            'yatube_fragment_cache_total'
+            '{fragment="anonymous_page",result="hit"} 1.0', text)
+        self.assertIn('yatube_cache_lookups_total{level="l1"', text)
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from .. import profiling
+
+User = get_user_model()
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.mkdtemp()
+        override = override_settings(
+            PROFILE_DIR=self.root, PROFILE_INTERVAL=0.001)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def dumps(self, view='posts:index'):
+        directory = profiling._view_dir(view)
+        if not os.path.isdir(directory):
+            return []
+        return os.listdir(directory)
+
+    def test_sampler(self):
+        with profiling.Sampler(0.001) as sampler:
+            busy(0.05)
+        self.assertTrue(sampler.stacks)
+        stack = sampler.stacks.most_common(1)[0][0]
+        self.assertTrue(stack.startswith('core/tests/test_profiling.py:busy'))
+
+    def test_not_profiled_by_default(self):
+        self.client.get('/?profile=1')
+        self.assertEqual(self.dumps(), [])
+
+    def test_staff_flag(self):
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        self.client.get('/?profile=1')
+        self.assertEqual(len(self.dumps()), 1)
+
+    def test_signed_header(self):
+        self.client.get('/', HTTP_X_PROFILE='profile:подделка')
+        self.assertEqual(self.dumps(), [])
+        self.client.get('/', HTTP_X_PROFILE=profiling.make_token())
+        self.assertEqual(len(self.dumps()), 1)
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_sample_rate(self):
+        self.client.get('/')
+        self.client.get('/missing-page/')
+        self.assertEqual(len(self.dumps()), 1)
+        self.assertEqual(len(self.dumps('unresolved')), 1)
+
+    def test_report(self):
+        profiling.dump('posts:index', Counter({'a;b': 2, 'a': 1}))
+        profiling.dump('posts:index', Counter({'a;b': 3}))
+        profiling.dump('posts:profile', Counter({'c': 1}))
+        out, err = StringIO(), StringIO()
+        call_command('profile_report', 'posts:index', stdout=out, stderr=err)
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            ['posts:index;a 1', 'posts:index;a;b 5'],
+        )
+        self.assertIn('posts:index: запросов 2', err.getvalue())
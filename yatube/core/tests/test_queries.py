@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ..queries import fingerprint, record
+
+User = get_user_model()
+
+
+class QueryRecorderTests(TestCase):
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            fingerprint('SELECT 1 FROM t WHERE id IN (%s, %s)'),
+            fingerprint('SELECT 1 FROM t  WHERE id IN (%s)'),
+        )
+        self.assertNotEqual(
+            fingerprint('SELECT 1 FROM t'), fingerprint('SELECT 2 FROM t'))
+
+    def test_record_counts_duplicates(self):
+        users = [User.objects.create_user(username=f'u{i}') for i in range(3)]
+        with record() as recorder:
+            for user in users:
+                User.objects.get(pk=user.pk)
+            User.objects.count()
+        self.assertEqual(recorder.count, 4)
+        self.assertGreater(recorder.duration, 0)
+        [(key, count)] = recorder.duplicates()
+        self.assertEqual(count, 3)
+        self.assertIn('auth_user', recorder.statements[key])
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(QUERY_BUDGET_HEADERS=True)
+    def test_headers(self):
+        response = self.client.get('/')
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertTrue(response['X-Query-Time'].endswith('ms'))
+        self.assertEqual(response['X-Query-Budget'], '6')
+
+    @override_settings(QUERY_BUDGET_HEADERS=False)
+    def test_no_headers_in_production(self):
+        response = self.client.get('/')
+        self.assertNotIn('X-Query-Count', response)
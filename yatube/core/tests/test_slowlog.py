@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from posts.models import Post
+
+from .. import slowlog
+
+User = get_user_model()
+
+
+class SlowQueryLogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(username='author')
+        Post.objects.create(author=author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.mkdtemp()
+        self.log = os.path.join(self.root, 'logs', 'slow.log')
+        # Порог 0: в журнал попадает каждый запрос
+        override = override_settings(
+            SLOW_QUERY_THRESHOLD=0, SLOW_QUERY_LOG=self.log)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def tearDown(self):
+        for handler in slowlog._handlers.values():
+            handler.close()
+        slowlog._handlers.clear()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_entry(self):
+        self.client.get('/')
+        entries = list(slowlog.read())
+        self.assertTrue(entries)
+        entry = next(
+            entry for entry in entries if 'posts_post' in entry['sql'])
+        self.assertEqual(entry['view'], 'posts:index')
+        self.assertTrue(entry['call_site'].startswith('posts/'))
+        self.assertTrue(entry['plan'])
+        self.assertNotIn('Пост', entry['params'])
+
+    @override_settings(SLOW_QUERY_THRESHOLD=None)
+    def test_disabled(self):
+        self.client.get('/')
+        self.assertFalse(os.path.exists(os.path.dirname(self.log)))
+
+    def test_process_logs_are_merged(self):
+        """У каждого процесса свой файл; read() сливает их по времени."""
+        self.client.get('/')
+        own = os.path.join(self.root, 'logs', f'slow.{os.getpid()}.log')
+        self.assertTrue(os.path.exists(own))
+        other = os.path.join(self.root, 'logs', 'slow.1.log')
+        with open(other, 'w') as file_:
+            file_.write('{"time": "2000-01-01T00:00:00+00:00", '
+                        '"sql": "другой процесс"}\n')
+        entries = list(slowlog.read())
+        self.assertEqual(entries[0]['sql'], 'другой процесс')
+        self.assertGreater(len(entries), 1)
+
+    def test_params_shape(self):
+        self.assertEqual(slowlog.params_shape((1, 2, 3, 'a')), '(int*3, str)')
+        self.assertEqual(
+            slowlog.params_shape([(1, 'a'), (2, 'b')], many=True),
+            '2x(int, str)',
+        )
+
+    def test_summary(self):
+        for _ in range(3):
+            cache.clear()
+            self.client.get('/')
+        with open(self.log, 'a') as file_:
+            file_.write('{"оборванная')
+        offenders = slowlog.summarize(slowlog.read(), 'count')
+        self.assertEqual(offenders[0]['count'], 3)
+        out = StringIO()
+        call_command('slow_queries', top=2, view='posts:index', stdout=out)
+        self.assertIn('1. ', out.getvalue())
+        self.assertIn('posts:index', out.getvalue())
+        self.assertNotIn('3. ', out.getvalue())
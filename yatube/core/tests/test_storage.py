@@ -0,0 +1,46 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+
+from ..storage import ContentAddressedStorage
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location, ignore_errors=True)
+
+    def files(self):
+        return [
+            os.path.join(root, name)
+            for root, _, names in os.walk(self.location)
+            for name in names
+        ]
+
+    def test_name_is_content_hash(self):
+        digest = hashlib.sha256(b'data').hexdigest()
+        name = self.storage.save('posts/photo.JPEG', ContentFile(b'data'))
+        self.assertEqual(
+            name, f'posts/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        with self.storage.open(name) as file_:
+            self.assertEqual(file_.read(), b'data')
+
+    def test_same_content_stored_once(self):
+        """Одинаковое содержимое под разными именами хранится один раз."""
+        first = self.storage.save('posts/a.png', ContentFile(b'data'))
+        second = self.storage.save('posts/b.png', ContentFile(b'data'))
+        other = self.storage.save('posts/c.png', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(len(self.files()), 2)
+
+    def test_deconstruct(self):
+        path, args, kwargs = ContentAddressedStorage().deconstruct()
+        self.assertEqual(path, 'core.storage.ContentAddressedStorage')
@@ -0,0 +1,57 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.template.loader_tags import IncludeNode
+from django.test import TestCase, override_settings
+
+from posts.models import Post
+
+from .. import template_timing
+
+User = get_user_model()
+
+
+class TemplateTimingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(username='author')
+        Post.objects.bulk_create(
+            Post(author=author, text=f'Пост {index}') for index in range(3))
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(template_timing.uninstall)
+
+    def test_disabled(self):
+        render = IncludeNode.render
+        response = self.client.get('/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertIs(IncludeNode.render, render)
+
+    @override_settings(TEMPLATE_TIMING=True)
+    def test_breakdown(self):
+        with self.assertLogs('core.template_timing', 'INFO') as logs:
+            response = self.client.get('/')
+        header = response['Server-Timing']
+        self.assertTrue(header.startswith('template;dur='))
+        self.assertIn('desc="include includes/article.html x3"', header)
+        self.assertIn('desc="fragment_cache index_page x1"', header)
+        self.assertIn('desc="block content x1"', header)
+        self.assertTrue(response['X-Template-Time'].endswith('ms'))
+        self.assertIn('includes/article.html', logs.output[0])
+
+    def test_own_time_excludes_children(self):
+        timings = template_timing.Timings()
+
+        def inner(node, context):
+            return 'inner'
+
+        def outer(node, context):
+            return timings.measure('inner', inner, node, context)
+
+        self.assertEqual(timings.measure('outer', outer, None, None), 'inner')
+        count, total, own = timings.entries['outer']
+        self.assertEqual(count, 1)
+        self.assertLessEqual(own, total)
+        self.assertAlmostEqual(
+            own + timings.entries['inner'][1], total, places=6)
+        self.assertEqual(timings.total, total)
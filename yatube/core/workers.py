@@ -0,0 +1,57 @@
+"""Пул процессов для тяжёлой фоновой работы (картинки, миниатюры).
+
+Процессы запускаются через spawn: они не наследуют соединения с базой и
+потоки родителя, а Django в них настраивается заново.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def setup_django(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def get_executor(max_workers=None):
+    """Общий пул процессов, создаётся при первом обращении."""
+    global _executor
+    if _executor is None:
+        _executor = make_executor(max_workers or settings.BACKGROUND_WORKERS)
+        atexit.register(_executor.shutdown, wait=False)
+    return _executor
+
+
+def make_executor(max_workers):
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=setup_django,
+        initargs=(os.environ['DJANGO_SETTINGS_MODULE'],),
+    )
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error(
+            'Фоновая задача завершилась ошибкой',
+            exc_info=future.exception(),
+        )
+
+
+def submit(function, *args):
+    """Ставит задачу в пул; при BACKGROUND_WORKERS = 0 выполняет сразу."""
+    if not settings.BACKGROUND_WORKERS:
+        return function(*args)
+    future = get_executor().submit(function, *args)
+    future.add_done_callback(_log_failure)
+    return future
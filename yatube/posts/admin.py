@@ -1,4 +1,7 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
+
+from . import search
 from .models import Post, Group, Comment
 
 
@@ -8,6 +11,18 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
+    readonly_fields = (
+        'image_width', 'image_height', 'image_format', 'image_size',
+        'image_hash',
+    )
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по полнотекстовому индексу вместо LIKE по всем постам."""
+        if not search.is_supported() or not search.build_query(search_term):
+            return super().get_search_results(
+                request, queryset, search_term)
+        return queryset.filter(
+            pk__in=RawSQL(*search.matching_ids(search_term))), False
 
 
 class CommentAdmin(admin.ModelAdmin):
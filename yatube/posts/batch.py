@@ -0,0 +1,163 @@
+"""Пакетное создание постов и комментариев.
+
+Каждый элемент проверяется своей формой (PostForm, CommentForm), а все
+прошедшие проверку вставляются через bulk_create в одной транзакции.
+bulk_create не шлёт сигналов, поэтому их работу - счётчики, ленты
+подписчиков, полнотекстовый индекс, версии кеша - здесь выполняют
+один раз на пакет, а не на каждый объект.
+
+Если id вставленных строк узнать нельзя (база их не возвращает и это
+не SQLite внутри транзакции), объекты сохраняются по одному через
+save(), и всё перечисленное делают сигналы.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+
+from core import cache as fragments
+
+from . import counters, feeds, search
+from .forms import CommentForm, PostForm
+from .models import Comment, Post
+from .utils import post_scopes
+
+
+def _assign_pks(model, objects):
+    """Проставляет id объектам после bulk_create на SQLite.
+
+    SQLite id новых строк не возвращает. Но первая запись в транзакции
+    берёт блокировку записи на всю базу и держит её до коммита, поэтому
+    между вставкой и этим чтением никто другой строк не добавит, и
+    последние len(objects) id таблицы - это наши строки, по порядку.
+    Вызывать только внутри transaction.atomic(), см. _insert.
+    """
+    pks = list(model.objects.order_by('-pk').values_list(
+        'pk', flat=True)[:len(objects)])
+    for obj, pk in zip(objects, reversed(pks)):
+        obj.pk = pk
+
+
+def _insert(model, objects):
+    """Вставляет объекты; False, если пришлось сохранять по одному.
+
+    В этом случае счётчики, ленты, индекс и кеш уже обновили сигналы.
+    """
+    if connection.features.can_return_ids_from_bulk_insert:
+        model.objects.bulk_create(objects)
+        return True
+    if connection.vendor == 'sqlite' and connection.in_atomic_block:
+        model.objects.bulk_create(objects)
+        _assign_pks(model, objects)
+        return True
+    for obj in objects:
+        obj.save()
+    return False
+
+
+def _error(field, message, code):
+    # В том же виде, что form.errors.get_json_data()
+    return {field: [{'message': message, 'code': code}]}
+
+
+def _validate(form_class, items, **extra):
+    """Результаты по элементам; у прошедших проверку - объект без id."""
+    results = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results.append({'index': index, 'errors': _error(
+                '__all__', 'Ожидается объект', 'invalid')})
+            continue
+        form = form_class(data=item)
+        if not form.is_valid():
+            results.append(
+                {'index': index, 'errors': form.errors.get_json_data()})
+            continue
+        obj = form.save(commit=False)
+        for field, value in extra.items():
+            setattr(obj, field, value)
+        results.append({'index': index, 'object': obj})
+    return results
+
+
+def _objects(results):
+    return [result['object'] for result in results if 'object' in result]
+
+
+def _finish(results):
+    for result in results:
+        obj = result.pop('object', None)
+        if obj is not None:
+            result['id'] = obj.pk
+    return results
+
+
+def create_posts(author, items):
+    """Создаёт посты автора из списка словарей полей PostForm."""
+    results = _validate(PostForm, items, author=author)
+    posts = _objects(results)
+    if posts:
+        with transaction.atomic():
+            bulk = _insert(Post, posts)
+            if bulk:
+                counters.change_user(author.pk, posts_count=len(posts))
+                for group_id, count in Counter(
+                        post.group_id for post in posts
+                        if post.group_id).items():
+                    counters.change_group(group_id, count)
+                search.index_posts(posts)
+                feeds.fan_out(posts)
+        if bulk:
+            scopes = set()
+            for post in posts:
+                scopes.update(
+                    post_scopes(post.pk, post.author_id, post.group_id))
+            fragments.bump_on_commit(*scopes)
+    return _finish(results)
+
+
+def _post_id(item):
+    # bool - тоже int, но true не должен означать пост с id 1
+    post_id = item.get('post') if isinstance(item, dict) else None
+    return post_id if type(post_id) is int else None
+
+
+def create_comments(author, items):
+    """Создаёт комментарии к существующим постам: {'post': id, 'text'}."""
+    existing = set(Post.objects.filter(
+        pk__in={_post_id(item) for item in items} - {None}
+    ).values_list('pk', flat=True))
+    results = _validate(CommentForm, items, author=author)
+    for result, item in zip(results, items):
+        if 'object' not in result:
+            continue
+        post_id = _post_id(item)
+        if post_id is None:
+            del result['object']
+            result['errors'] = _error(
+                'post', 'Ожидается id поста', 'invalid')
+        elif post_id not in existing:
+            del result['object']
+            result['errors'] = _error('post', 'Пост не найден', 'invalid')
+        else:
+            result['object'].post_id = post_id
+    comments = _objects(results)
+    if comments:
+        per_post = Counter(comment.post_id for comment in comments)
+        with transaction.atomic():
+            bulk = _insert(Comment, comments)
+            if bulk:
+                for post_id, count in per_post.items():
+                    counters.change_post(post_id, count)
+        if bulk:
+            fragments.bump_on_commit(
+                *(f'post:{post_id}' for post_id in per_post))
+    return _finish(results)
+
+
+def create(author, posts=(), comments=()):
+    """Посты и комментарии одного запроса в одной транзакции."""
+    with transaction.atomic():
+        return {
+            'posts': create_posts(author, posts),
+            'comments': create_comments(author, comments),
+        }
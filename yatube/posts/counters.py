@@ -0,0 +1,145 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются атомарными UPDATE ... SET x = x + 1 в сигналах
+моделей, поэтому страницы читают готовые числа вместо COUNT(*).
+Разошедшиеся значения чинит команда recount_counters.
+
+Так же считаются ссылки постов на файлы картинок (StoredImage): файл
+с одинаковым содержимым хранится один раз на все посты.
+"""
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import (Comment, Follow, Group, Post, StoredImage, User,
+                     UserCounters)
+
+
+def _deltas(**deltas):
+    # Greatest не даёт счётчику уйти в минус, если он уже разошёлся
+    return {
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    }
+
+
+def change_user(user_id, **deltas):
+    """Сдвигает счётчики пользователя.
+
+    Отсутствующую строку не создаём: её пересчитает for_user при чтении.
+    """
+    UserCounters.objects.filter(pk=user_id).update(**_deltas(**deltas))
+
+
+def change_group(group_id, delta):
+    Group.objects.filter(pk=group_id).update(**_deltas(posts_count=delta))
+
+
+def change_post(post_id, delta):
+    """Сдвигает число комментариев; пост при этом считается изменённым."""
+    Post.objects.filter(pk=post_id).update(
+        updated_at=timezone.now(), **_deltas(comments_count=delta))
+
+
+def change_image(name, delta):
+    """Сдвигает число ссылок на файл картинки."""
+    if not name:
+        return
+    if delta > 0:
+        StoredImage.objects.bulk_create(
+            [StoredImage(name=name)], ignore_conflicts=True)
+    StoredImage.objects.filter(name=name).update(
+        updated=timezone.now(), **_deltas(references=delta))
+
+
+def for_user(user):
+    """Счётчики пользователя; отсутствующая строка пересчитывается."""
+    try:
+        return user.counters
+    except UserCounters.DoesNotExist:
+        recount_users([user.pk])
+        return UserCounters.objects.get(pk=user.pk)
+
+
+def _counts(queryset, field):
+    return dict(
+        queryset.order_by().values_list(field).annotate(total=Count('pk'))
+    )
+
+
+def recount_users(user_ids):
+    """Пересчитывает счётчики пользователей по данным таблиц."""
+    posts = _counts(Post.objects.filter(author_id__in=user_ids), 'author_id')
+    followers = _counts(
+        Follow.objects.filter(author_id__in=user_ids), 'author_id')
+    following = _counts(
+        Follow.objects.filter(user_id__in=user_ids), 'user_id')
+    counters = [
+        UserCounters(
+            user_id=user_id,
+            posts_count=posts.get(user_id, 0),
+            followers_count=followers.get(user_id, 0),
+            following_count=following.get(user_id, 0),
+        )
+        for user_id in user_ids
+    ]
+    with transaction.atomic():
+        UserCounters.objects.bulk_create(counters, ignore_conflicts=True)
+        UserCounters.objects.bulk_update(
+            counters,
+            ['posts_count', 'followers_count', 'following_count'],
+        )
+
+
+def recount_posts(post_ids):
+    comments = _counts(
+        Comment.objects.filter(post_id__in=post_ids), 'post_id')
+    Post.objects.bulk_update(
+        [
+            Post(pk=post_id, comments_count=comments.get(post_id, 0))
+            for post_id in post_ids
+        ],
+        ['comments_count'],
+    )
+
+
+def recount_groups(group_ids):
+    posts = _counts(Post.objects.filter(group_id__in=group_ids), 'group_id')
+    Group.objects.bulk_update(
+        [
+            Group(pk=group_id, posts_count=posts.get(group_id, 0))
+            for group_id in group_ids
+        ],
+        ['posts_count'],
+    )
+
+
+def recount_images(names):
+    references = _counts(Post.objects.filter(image__in=names), 'image')
+    StoredImage.objects.bulk_update(
+        [
+            StoredImage(name=name, references=references.get(name, 0))
+            for name in names
+        ],
+        ['references'],
+    )
+
+
+def recount_all(batch_size=1000):
+    """Пересчитывает все счётчики пачками по batch_size объектов."""
+    for model, recount in (
+        (User, recount_users),
+        (Post, recount_posts),
+        (Group, recount_groups),
+        (StoredImage, recount_images),
+    ):
+        ids = model.objects.order_by('pk').values_list('pk', flat=True)
+        batches = ids
+        while True:
+            batch = list(batches[:batch_size])
+            if not batch:
+                break
+            recount(batch)
+            batches = ids.filter(pk__gt=batch[-1])
+            yield model, len(batch)
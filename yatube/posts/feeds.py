@@ -0,0 +1,291 @@
+"""Материализованная лента подписок (fan-out-on-write).
+
+Новый пост сразу раскладывается по лентам подписчиков автора, поэтому
+чтение /follow/ - это диапазон по индексу (user, pub_date, post) в
+FeedEntry, а не join через Follow: посты страницы затем берутся по id.
+Лента каждого пользователя ограничена settings.FEED_MAX_ENTRIES
+записями.
+
+Авторы, у которых подписчиков больше settings.FEED_FANOUT_THRESHOLD,
+по лентам не раскладываются: их свежие посты кешируются списком на
+автора и сливаются с материализованной лентой при чтении (гибридный
+режим). Так запись поста популярного автора не превращается в тысячи
+вставок. Когда после отписки автор опускается до порога, demote
+дописывает его посты в ленты подписчиков: иначе написанное им в
+гибридном режиме из лент бы пропало.
+"""
+import heapq
+from collections import namedtuple
+from itertools import dropwhile, islice, takewhile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from core import workers
+from core.cache import get_or_compute
+
+from .models import FeedEntry, Follow, Post, UserCounters
+from .paginators import NEXT, PREVIOUS, decode_cursor
+from .utils import LIMIT, get_page
+
+FeedKey = namedtuple('FeedKey', ['pub_date', 'pk'])
+
+CELEBRITIES_KEY = 'feed:celebrities'
+CELEBRITIES_TIMEOUT = 60 * 5
+AUTHOR_KEY = 'feed:author:{}'
+
+
+def feed_keys(user):
+    """Записи ленты пользователя в порядке индекса."""
+    return FeedEntry.objects.filter(user=user).order_by(
+        '-pub_date', '-post_id')
+
+
+def celebrity_ids():
+    """Авторы, чьи посты не раскладываются по лентам, а сливаются при чтении.
+
+    Запись и чтение должны видеть один и тот же набор, поэтому он
+    вычисляется один раз и кешируется.
+    """
+    return get_or_compute(
+        CELEBRITIES_KEY,
+        lambda: set(
+            UserCounters.objects.filter(
+                followers_count__gt=settings.FEED_FANOUT_THRESHOLD
+            ).values_list('user_id', flat=True)
+        ),
+        CELEBRITIES_TIMEOUT,
+        name='feed_celebrities',
+    )
+
+
+def author_keys(author_id):
+    """Свежие посты автора по убыванию (pub_date, id), кешируются."""
+    return get_or_compute(
+        AUTHOR_KEY.format(author_id),
+        lambda: [
+            FeedKey(*row) for row in Post.objects.filter(
+                author_id=author_id
+            ).order_by('-pub_date', '-pk').values_list(
+                'pub_date', 'pk'
+            )[:settings.FEED_MAX_ENTRIES]
+        ],
+        settings.FEED_AUTHOR_CACHE_TIMEOUT,
+        name='feed_author',
+    )
+
+
+def invalidate_author(author_id):
+    """Сбрасывает кеш свежих постов автора."""
+    cache.delete(AUTHOR_KEY.format(author_id))
+
+
+def _window(request):
+    """Какая часть ленты нужна запросу: (направление, курсор, число ключей).
+
+    По курсору хватает LIMIT + 1 ключей за ним, по номеру страницы -
+    первых page * LIMIT + 1 ключей.
+    """
+    if 'cursor' in request.GET:
+        direction, key = decode_cursor(request.GET['cursor'])
+        return direction, key, LIMIT + 1
+    try:
+        number = max(int(request.GET.get('page', 1)), 1)
+    except (TypeError, ValueError):
+        number = 1
+    return NEXT, None, min(number * LIMIT + 1, settings.FEED_MAX_ENTRIES)
+
+
+def _entry_keys(user, direction, key, limit):
+    """Ключи материализованной ленты за курсором, по убыванию."""
+    entries = feed_keys(user)
+    if direction == PREVIOUS:
+        entries = entries.reverse().filter(
+            Q(pub_date__gt=key[0]) | Q(pub_date=key[0], post_id__gt=key[1]))
+    elif key is not None:
+        entries = entries.filter(
+            Q(pub_date__lt=key[0]) | Q(pub_date=key[0], post_id__lt=key[1]))
+    keys = [
+        FeedKey(*row) for row in entries.values_list(
+            'pub_date', 'post_id'
+        )[:limit]
+    ]
+    if direction == PREVIOUS:
+        keys.reverse()
+    return keys
+
+
+def _author_window(keys, direction, key, limit):
+    """Та же часть кешированного списка постов автора."""
+    if key is None:
+        return keys[:limit]
+    if direction == PREVIOUS:
+        return list(takewhile(lambda item: item > key, keys))[-limit:]
+    return list(islice(dropwhile(lambda item: item >= key, keys), limit))
+
+
+def get_feed_page(request, user):
+    """Страница ленты подписок с учётом гибридного режима.
+
+    Из каждого источника читается только нужная странице часть. Без
+    популярных авторов страница по номеру - это OFFSET по индексу, и
+    число страниц известно; в гибридном режиме Paginator знает страницы
+    лишь до следующей за текущей.
+    """
+    celebrities = celebrity_ids()
+    authors = []
+    if celebrities:
+        authors = Follow.objects.filter(
+            user=user, author_id__in=celebrities
+        ).values_list('author_id', flat=True)
+    if not authors and 'cursor' not in request.GET:
+        page_obj = get_page(
+            request, feed_keys(user).values_list('post_id', flat=True))
+        post_ids = list(page_obj.object_list)
+    else:
+        direction, key, limit = _window(request)
+        streams = [
+            _author_window(author_keys(author_id), direction, key, limit)
+            for author_id in authors
+        ]
+        streams.append(_entry_keys(user, direction, key, limit))
+        merged, seen = [], set()
+        # k-way слияние отсортированных по убыванию списков
+        for item in heapq.merge(*streams, reverse=True):
+            if item.pk not in seen:
+                seen.add(item.pk)
+                merged.append(item)
+        # Перед курсором PREVIOUS нужны ближайшие к нему, то есть последние
+        merged = merged[-limit:] if direction == PREVIOUS else merged[:limit]
+        page_obj = get_page(request, merged)
+        post_ids = [item.pk for item in page_obj.object_list]
+    found = Post.objects.select_related('author', 'group').in_bulk(post_ids)
+    page_obj.object_list = [
+        found[post_id] for post_id in post_ids if post_id in found
+    ]
+    return page_obj
+
+
+def fan_out(posts):
+    """Раскладывает новые посты по лентам подписчиков их авторов."""
+    entries = []
+    celebrities = celebrity_ids()
+    # Подписчики читаются один раз на автора, а не на каждый пост
+    followers_of = {}
+    for post in posts:
+        if post.author_id in celebrities:
+            invalidate_author(post.author_id)
+            continue
+        if post.author_id not in followers_of:
+            followers_of[post.author_id] = list(Follow.objects.filter(
+                author_id=post.author_id
+            ).values_list('user_id', flat=True))
+        followers = followers_of[post.author_id]
+        entries.extend(
+            FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers
+        )
+    FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    if entries:
+        # Подзапрос, а не список: подписчиков может быть больше, чем
+        # параметров в одном запросе
+        trim(Follow.objects.filter(
+            author_id__in=list(followers_of)
+        ).values('user_id'))
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    if author_id in celebrity_ids():
+        return
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).order_by('-pub_date').only('pk', 'pub_date')
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for post in posts[:settings.FEED_MAX_ENTRIES]
+        ],
+        ignore_conflicts=True,
+    )
+    trim([user_id])
+
+
+def check_demotion(author_id):
+    """После отписки: не опустился ли автор до порога раскладки.
+
+    Отписки уменьшают счётчик по одному, поэтому переход через порог -
+    это ровно FEED_FANOUT_THRESHOLD подписчиков.
+    """
+    followers = UserCounters.objects.filter(pk=author_id).values_list(
+        'followers_count', flat=True
+    ).first()
+    if followers == settings.FEED_FANOUT_THRESHOLD:
+        transaction.on_commit(lambda: workers.submit(demote, author_id))
+
+
+def demote(author_id):
+    """Раскладывает по лентам подписчиков посты бывшего популярного автора."""
+    # Новые посты автора сразу пойдут через fan_out
+    cache.delete(CELEBRITIES_KEY)
+    keys = author_keys(author_id)
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+    for user_id in followers:
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(user_id=user_id, post_id=key.pk,
+                          pub_date=key.pub_date)
+                for key in keys
+            ],
+            ignore_conflicts=True,
+        )
+        trim([user_id])
+
+
+def remove(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def trim(user_ids):
+    """Оставляет в лентах только FEED_MAX_ENTRIES свежих записей.
+
+    user_ids - список или запрос id. Ленты больше предела находит один
+    запрос с группировкой; для остальных лишних запросов нет.
+    """
+    overflowing = FeedEntry.objects.filter(
+        user_id__in=user_ids
+    ).order_by().values('user_id').annotate(
+        entries=Count('pk')
+    ).filter(
+        entries__gt=settings.FEED_MAX_ENTRIES
+    ).values_list('user_id', flat=True)
+    for user_id in overflowing:
+        stale = FeedEntry.objects.filter(
+            user_id=user_id
+        ).order_by('-pub_date', '-post_id').values_list(
+            'pk', flat=True
+        )[settings.FEED_MAX_ENTRIES:]
+        stale = list(stale)
+        if stale:
+            FeedEntry.objects.filter(pk__in=stale).delete()
+
+
+def rebuild(user_id):
+    """Пересобирает ленту пользователя с нуля по его подпискам."""
+    FeedEntry.objects.filter(user_id=user_id).delete()
+    posts = Post.objects.filter(
+        author__following__user_id=user_id
+    ).exclude(
+        author_id__in=celebrity_ids()
+    ).order_by('-pub_date').only('pk', 'pub_date')
+    FeedEntry.objects.bulk_create(
+        FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+        for post in posts[:settings.FEED_MAX_ENTRIES]
+    )
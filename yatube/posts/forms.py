@@ -1,4 +1,7 @@
 from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.template.defaultfilters import filesizeformat
 from .models import Post, Comment
 
 
@@ -10,6 +13,20 @@ class PostForm(forms.ModelForm):
             'image': 'Изображение'
         }
 
+    def clean_image(self):
+        """Проверка по заголовку: пиксели ещё не декодированы."""
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return image
+        if image.size > settings.MAX_UPLOAD_SIZE:
+            raise forms.ValidationError(
+                'Файл больше %s' % filesizeformat(settings.MAX_UPLOAD_SIZE))
+        width, height = image.image.size
+        if width * height > settings.MAX_IMAGE_PIXELS:
+            raise forms.ValidationError(
+                f'Слишком большое изображение: {width}x{height}')
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
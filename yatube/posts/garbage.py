@@ -0,0 +1,229 @@
+"""Сборка мусора в MEDIA_ROOT: файлы картинок и миниатюр без ссылок.
+
+Ни список файлов, ни список ссылок целиком в памяти не держим. Имена
+файлов, на которые есть ссылки, пишутся во временную базу SQLite на
+диске и читаются из неё отсортированными; каталоги обходятся в том же
+порядке сортировки, и два отсортированных потока сливаются (merge
+join). Память не зависит от числа файлов.
+
+Ссылками считаются:
+- Post.image;
+- StoredImage с ненулевым числом ссылок или изменённые недавно (пост с
+  этой картинкой может ещё сохраняться);
+- миниатюры sorl-thumbnail, чей исходник сам на что-то ссылается.
+
+Файлы моложе min_age не трогаются никогда: их могли только что
+записать, ещё не закоммитив ссылку.
+"""
+import os
+import sqlite3
+import tempfile
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.helpers import deserialize, tokey
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .models import Post, StoredImage
+
+CHUNK_SIZE = 2000
+
+Garbage = namedtuple('Garbage', ['name', 'path', 'size'])
+
+
+def walk(root, relative=''):
+    """Файлы под root в порядке сортировки их относительных путей.
+
+    Каталог сортируется как "имя/": тогда "a.txt" идёт раньше "a/b",
+    как и при сравнении строк. В памяти одновременно только один
+    каталог на каждом уровне вложенности.
+    """
+    try:
+        entries = list(os.scandir(os.path.join(root, relative)))
+    except FileNotFoundError:
+        return
+    keyed = []
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            keyed.append((entry.name + '/', entry))
+        elif entry.is_file(follow_symlinks=False):
+            keyed.append((entry.name, entry))
+    keyed.sort(key=lambda item: item[0])
+    for key, entry in keyed:
+        name = relative + key
+        if key.endswith('/'):
+            yield from walk(root, name)
+        else:
+            yield name, entry
+
+
+class References:
+    """Отсортированное множество имён во временной базе SQLite."""
+
+    def __init__(self, directory):
+        self.connection = sqlite3.connect(
+            os.path.join(directory, 'references.sqlite3'))
+        self.connection.execute('PRAGMA journal_mode=OFF')
+        self.connection.execute('PRAGMA synchronous=OFF')
+        # names - имена файлов со ссылками, sources - ключи kvstore их
+        # исходников, dead - ключи исходников без ссылок
+        for table in ('names', 'sources', 'dead'):
+            self.connection.execute(
+                f'CREATE TABLE {table} (name TEXT PRIMARY KEY) WITHOUT ROWID')
+
+    def add(self, names, table='names'):
+        self.connection.executemany(
+            f'INSERT OR IGNORE INTO {table} VALUES (?)',
+            ((name,) for name in names),
+        )
+
+    def __contains__(self, source_key):
+        return self.connection.execute(
+            'SELECT 1 FROM sources WHERE name = ?', (source_key,)
+        ).fetchone() is not None
+
+    def __iter__(self):
+        return self.sorted('names')
+
+    def sorted(self, table):
+        cursor = self.connection.execute(
+            f'SELECT name FROM {table} ORDER BY name')
+        for name, in cursor:
+            yield name
+
+    def close(self):
+        self.connection.close()
+
+
+def _chunks(iterable, size=CHUNK_SIZE):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _image_names(min_age):
+    yield from Post.objects.exclude(image='').exclude(image=None).order_by(
+        'image').values_list('image', flat=True).distinct().iterator()
+    recent = timezone.now() - min_age
+    yield from StoredImage.objects.filter(
+        Q(references__gt=0) | Q(updated__gte=recent)
+    ).values_list('name', flat=True).iterator()
+
+
+def collect_references(references, min_age):
+    """Заполняет references именами всех файлов, на которые есть ссылки.
+
+    Заодно запоминает ключи kvstore исходников, на которые ссылок нет:
+    их записи о миниатюрах устареют вместе с файлами.
+    """
+    field = Post._meta.get_field('image')
+    storage_key = ImageFile(
+        field.upload_to, field.storage).serialize_storage()
+    for names in _chunks(_image_names(min_age)):
+        references.add(names)
+        references.add(
+            (tokey(name, storage_key) for name in names), table='sources')
+    prefix = add_prefix('', 'thumbnails')
+    rows = KVStoreModel.objects.filter(key__startswith=prefix).values_list(
+        'key', 'value').iterator()
+    for rows in _chunks(rows):
+        thumbnail_keys, dead = [], []
+        for key, value in rows:
+            source_key = key[len(prefix):]
+            if source_key in references:
+                thumbnail_keys.extend(deserialize(value))
+            else:
+                dead.append(source_key)
+        references.add(dead, table='dead')
+        images = KVStoreModel.objects.filter(key__in=[
+            add_prefix(thumbnail_key) for thumbnail_key in thumbnail_keys
+        ]).values_list('value', flat=True)
+        references.add(deserialize(value)['name'] for value in images)
+
+
+def unreferenced(root, prefixes, references, min_age):
+    """Файлы под prefixes, которых нет в references и которые старше min_age.
+
+    Оба потока отсортированы, поэтому сравниваются за один проход.
+    """
+    cutoff = time.time() - min_age.total_seconds()
+    referenced = iter(references)
+    current = next(referenced, None)
+    for prefix in sorted(prefixes):
+        for name, entry in walk(root, prefix):
+            while current is not None and current < name:
+                current = next(referenced, None)
+            if current == name:
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime > cutoff:
+                continue
+            yield Garbage(name, entry.path, stat.st_size)
+
+
+def remove(batch, quarantine=None):
+    """Удаляет файлы или переносит их в quarantine с теми же путями."""
+    for garbage in batch:
+        try:
+            if quarantine:
+                target = os.path.join(quarantine, garbage.name)
+                os.renames(garbage.path, target)
+            else:
+                os.remove(garbage.path)
+        except FileNotFoundError:
+            pass
+    StoredImage.objects.filter(
+        name__in=[garbage.name for garbage in batch], references=0).delete()
+
+
+def forget_sources(source_keys):
+    """Убирает из kvstore записи о миниатюрах исходников без ссылок."""
+    kvstore = default.kvstore
+    for keys in _chunks(source_keys):
+        raw_keys = []
+        for source_key in keys:
+            raw_keys.append(add_prefix(source_key))
+            raw_keys.append(add_prefix(source_key, 'thumbnails'))
+            for thumbnail_key in kvstore._get(
+                    source_key, identity='thumbnails') or []:
+                raw_keys.append(add_prefix(thumbnail_key))
+        kvstore._delete_raw(*raw_keys)
+
+
+def collect(dry_run=True, quarantine=None, batch_size=500,
+            min_age=timedelta(days=1)):
+    """Находит и убирает мусор пачками по batch_size файлов.
+
+    Генератор: отдаёт каждую пачку после обработки, чтобы команда могла
+    вести отчёт.
+    """
+    root = settings.MEDIA_ROOT
+    upload_to = Post._meta.get_field('image').upload_to
+    prefixes = {upload_to, thumbnail_settings.THUMBNAIL_PREFIX}
+    with tempfile.TemporaryDirectory() as directory:
+        references = References(directory)
+        try:
+            collect_references(references, min_age)
+            for batch in _chunks(
+                    unreferenced(root, prefixes, references, min_age),
+                    batch_size):
+                if not dry_run:
+                    remove(batch, quarantine)
+                yield batch
+            if not dry_run:
+                forget_sources(references.sorted('dead'))
+        finally:
+            references.close()
@@ -0,0 +1,68 @@
+"""Метаданные картинок постов.
+
+Размеры, формат, размер в байтах и хеш содержимого считаются один раз
+при сохранении картинки и хранятся в полях поста, чтобы шаблонам и
+миниатюрам не приходилось открывать файл.
+"""
+import hashlib
+import logging
+
+from django.core.exceptions import SuspiciousFileOperation
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+EMPTY_METADATA = {
+    'image_width': None,
+    'image_height': None,
+    'image_format': '',
+    'image_size': None,
+    'image_hash': '',
+}
+
+
+def read_metadata(file_):
+    """Метаданные открытого на чтение файла картинки."""
+    digest = hashlib.sha256()
+    size = 0
+    file_.seek(0)
+    for chunk in iter(lambda: file_.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    file_.seek(0)
+    # Image.open читает только заголовок, пиксели не декодируются
+    with Image.open(file_) as image:
+        width, height = image.size
+        format_ = image.format or ''
+    file_.seek(0)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_format': format_,
+        'image_size': size,
+        'image_hash': digest.hexdigest(),
+    }
+
+
+def field_metadata(field_file):
+    """Метаданные картинки поля: загруженной или уже лежащей в хранилище.
+
+    Если файл не читается, возвращает пустые метаданные.
+    """
+    try:
+        if not field_file._committed:
+            return read_metadata(field_file.file)
+        with field_file.storage.open(field_file.name, 'rb') as file_:
+            return read_metadata(file_)
+    except (OSError, ValueError, SuspiciousFileOperation,
+            Image.DecompressionBombError):
+        logger.warning('Не удалось прочитать картинку %s', field_file.name)
+        return dict(EMPTY_METADATA)
+
+
+def update_metadata(post):
+    """Заполняет поля метаданных поста по его картинке."""
+    metadata = field_metadata(post.image) if post.image else EMPTY_METADATA
+    for field, value in metadata.items():
+        setattr(post, field, value)
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from posts import images, thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заполняет метаданные картинок у постов, где их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов читать и сохранять за один проход',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересчитать метаданные и у постов, где они уже есть',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image=None)
+        if not options['force']:
+            posts = posts.filter(image_hash='')
+        posts = posts.order_by('pk').only('pk', 'image')
+        fields = list(images.EMPTY_METADATA)
+        updated = failed = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                posts.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            for post in batch:
+                images.update_metadata(post)
+                if post.image_hash:
+                    thumbnails.seed_source(
+                        post.image.name, post.image_width, post.image_height)
+                    updated += 1
+                else:
+                    failed += 1
+            Post.objects.bulk_update(batch, fields)
+            last_pk = batch[-1].pk
+        self.stdout.write(f'Обновлено: {updated}, не прочитано: {failed}')
@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageOps
+
+from core import workers
+from posts import uploads
+
+ORIENTATION = 0x0112
+
+
+def make_sample(path, megapixels):
+    """JPEG 3:2 с шумом и EXIF-поворотом, похожий на снимок с камеры."""
+    width = int((megapixels * 1_000_000 * 3 / 2) ** 0.5)
+    height = width * 2 // 3
+    noise = Image.effect_noise((width // 4, height // 4), 64).resize(
+        (width, height))
+    gradient = Image.linear_gradient('L').resize((width, height))
+    exif = Image.Exif()
+    exif[ORIENTATION] = 6
+    Image.merge('RGB', (
+        noise, gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT)
+    )).save(path, 'JPEG', quality=90, exif=exif.tobytes())
+
+
+def naive(source, output, max_side):
+    # Как было бы без draft/reduce: полное декодирование оригинала
+    with Image.open(source) as image:
+        image.load()
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), reducing_gap=None)
+        image.convert('RGB').save(output, 'JPEG', quality=85)
+
+
+def _memory(field):
+    # Linux: VmHWM - пиковый RSS процесса, VmRSS - текущий, в килобайтах
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError(f'В /proc/self/status нет {field}')
+
+
+def measure(path, mode, max_side, max_pixels):
+    """Выполняется в отдельном процессе: пиковый RSS, его прирост и время."""
+    # Сбрасываем пик до текущего RSS: после импортов он уже не нулевой
+    with open('/proc/self/clear_refs', 'w') as clear_refs:
+        clear_refs.write('5')
+    before = _memory('VmRSS')
+    started = time.perf_counter()
+    with open(path, 'rb') as source, tempfile.TemporaryFile() as output:
+        if mode == 'pipeline':
+            uploads.normalize_image(source, output, max_side, max_pixels)
+        else:
+            naive(source, output, max_side)
+    elapsed = time.perf_counter() - started
+    peak = _memory('VmHWM')
+    return peak, peak - before, elapsed
+
+
+class Command(BaseCommand):
+    help = 'Пиковая память и время обработки загрузки разного размера'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'megapixels', nargs='*', type=float, default=[12, 24, 40],
+            help='Размеры тестовых картинок в мегапикселях',
+        )
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        self.stdout.write(
+            f'{"Мп":>5} {"файл, МБ":>9} {"режим":>9} '
+            f'{"пик RSS, МБ":>12} {"прирост, МБ":>12} {"время, с":>9}'
+        )
+        try:
+            for megapixels in options['megapixels']:
+                path = os.path.join(directory, f'{megapixels}.jpg')
+                make_sample(path, megapixels)
+                size = os.path.getsize(path) / 1024 / 1024
+                for mode in ('naive', 'pipeline'):
+                    # Свежий процесс на каждый замер, чтобы память
+                    # предыдущего не влияла на результат
+                    with workers.make_executor(1) as executor:
+                        peak, growth, elapsed = executor.submit(
+                            measure,
+                            path,
+                            mode,
+                            settings.IMAGE_MAX_SIDE,
+                            max(settings.MAX_IMAGE_PIXELS, megapixels * 1e6),
+                        ).result()
+                    self.stdout.write(
+                        f'{megapixels:>5g} {size:>9.1f} {mode:>9} '
+                        f'{peak:>12.1f} {growth:>12.1f} {elapsed:>9.2f}'
+                    )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
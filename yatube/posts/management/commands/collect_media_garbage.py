@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from posts import garbage
+
+
+class Command(BaseCommand):
+    help = (
+        'Находит в MEDIA_ROOT картинки и миниатюры, на которые нет ссылок, '
+        'и удаляет или переносит их в карантин. По умолчанию только отчёт'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--delete', action='store_true',
+            help='Действительно удалить файлы, а не только показать отчёт',
+        )
+        parser.add_argument(
+            '--quarantine', metavar='DIR',
+            help='Вместо удаления переносить файлы в этот каталог '
+                 '(вне MEDIA_ROOT)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько файлов обрабатывать за один проход',
+        )
+        parser.add_argument(
+            '--min-age', type=float, default=24,
+            help='Не трогать файлы моложе этого числа часов',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = not (options['delete'] or options['quarantine'])
+        count = size = 0
+        for batch in garbage.collect(
+            dry_run=dry_run,
+            quarantine=options['quarantine'],
+            batch_size=options['batch_size'],
+            min_age=timedelta(hours=options['min_age']),
+        ):
+            for item in batch:
+                if options['verbosity'] > 1:
+                    self.stdout.write(item.name)
+            count += len(batch)
+            size += sum(item.size for item in batch)
+            if options['verbosity'] > 0:
+                self.stderr.write(f'... {count}')
+        action = (
+            'Можно убрать' if dry_run
+            else 'Перенесено в карантин' if options['quarantine']
+            else 'Удалено'
+        )
+        self.stdout.write(
+            f'{action} файлов: {count}, всего {filesizeformat(size)}')
@@ -0,0 +1,55 @@
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import counters
+from posts.models import Post, StoredImage
+
+HASHED_NAME = re.compile(r'/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки, загруженные до хранилища с адресацией по '
+        'содержимому, под имена-хеши; старые файлы убирает сборщик мусора'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько имён файлов обрабатывать за один проход',
+        )
+
+    def names(self, batch_size):
+        names = (
+            Post.objects.exclude(image='').exclude(image=None)
+            .order_by('image').values_list('image', flat=True).distinct()
+        )
+        last = ''
+        while True:
+            batch = list(names.filter(image__gt=last)[:batch_size])
+            if not batch:
+                return
+            yield [name for name in batch if not HASHED_NAME.search(name)]
+            last = batch[-1]
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        moved = failed = 0
+        for batch in self.names(options['batch_size']):
+            for name in batch:
+                try:
+                    with storage.open(name, 'rb') as file_:
+                        hashed = storage.save(name, file_)
+                except OSError as error:
+                    self.stderr.write(f'{name}: {error}')
+                    failed += 1
+                    continue
+                with transaction.atomic():
+                    Post.objects.filter(image=name).update(image=hashed)
+                    StoredImage.objects.bulk_create(
+                        [StoredImage(name=hashed)], ignore_conflicts=True)
+                    counters.recount_images([name, hashed])
+                moved += 1
+        self.stdout.write(f'Перенесено: {moved}, ошибок: {failed}')
@@ -0,0 +1,60 @@
+from concurrent.futures import as_completed
+
+from django.core.management.base import BaseCommand
+
+from core import workers
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие миниатюры картинок постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Сколько процессов создают миниатюры; 0 - в этом процессе',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов читать из базы за один проход',
+        )
+
+    def names(self, batch_size):
+        names = (
+            Post.objects.exclude(image='').order_by('pk')
+            .values_list('pk', 'image')
+        )
+        last_pk = 0
+        seen = set()
+        while True:
+            batch = list(names.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return
+            for _, name in batch:
+                if name not in seen:
+                    seen.add(name)
+                    yield name
+            last_pk = batch[-1][0]
+
+    def handle(self, *args, **options):
+        names = self.names(options['batch_size'])
+        if not options['workers']:
+            done = 0
+            for done, name in enumerate(names, 1):
+                thumbnails.generate(name)
+            self.stdout.write(f'Картинок обработано: {done}')
+            return
+        failed = 0
+        with workers.make_executor(options['workers']) as executor:
+            futures = {
+                executor.submit(thumbnails.generate, name): name
+                for name in names
+            }
+            for future in as_completed(futures):
+                if future.exception() is not None:
+                    failed += 1
+                    self.stderr.write(
+                        f'{futures[future]}: {future.exception()}')
+        self.stdout.write(
+            f'Картинок обработано: {len(futures) - failed}, ошибок: {failed}')
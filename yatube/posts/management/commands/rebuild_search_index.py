@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Строит полнотекстовый индекс постов заново'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError('Полнотекстовый индекс есть только на SQLite')
+        self.stdout.write(f'Проиндексировано постов: {search.rebuild()}')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько объектов пересчитывать за один проход',
+        )
+
+    def handle(self, *args, **options):
+        totals = {}
+        for model, count in counters.recount_all(options['batch_size']):
+            name = model._meta.verbose_name_plural
+            totals[name] = totals.get(name, 0) + count
+        for name, count in totals.items():
+            self.stdout.write(f'{name}: {count}')
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.16 on 2026-10-18 11:40
+
+from django.db import migrations
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE posts_post_fts USING fts5("
+    "text, tokenize = 'unicode61 remove_diacritics 2')"
+)
+FILL_SQL = (
+    "INSERT INTO posts_post_fts (rowid, text) "
+    "SELECT id, replace(replace(text, 'ё', 'е'), 'Ё', 'Е') FROM posts_post"
+)
+
+
+def create_index(apps, schema_editor):
+    # Полнотекстовый индекс есть только на SQLite (FTS5)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_SQL)
+    schema_editor.execute(FILL_SQL)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,127 @@
+import base64
+import binascii
+from datetime import datetime
+from itertools import islice
+
+from django.db.models import Q, QuerySet
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, post):
+    """Упаковывает позицию поста (pub_date, id) в непрозрачный токен."""
+    raw = f'{direction}|{post.pub_date.isoformat()}|{post.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен. Для пустого или битого токена - первая страница."""
+    if not token:
+        return NEXT, None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, pub_date, pk = raw.decode().split('|')
+        key = datetime.fromisoformat(pub_date), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return NEXT, None
+    # Даты в базе с часовым поясом: наивную с ними не сравнить
+    if direction not in (NEXT, PREVIOUS) or key[0].utcoffset() is None:
+        return NEXT, None
+    return direction, key
+
+
+class CursorPage:
+    """Страница ленты, полученная по курсору, без номера и общего числа."""
+    is_cursor = True
+    number = None
+
+    def __init__(self, object_list, cursor, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<Cursor page {self.cursor or "first"}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset-пагинация по (pub_date, id).
+
+    В отличие от Paginator не делает COUNT(*) и OFFSET: каждая страница -
+    это диапазонное чтение по индексу pub_date от позиции курсора.
+    """
+
+    def __init__(self, object_list, per_page):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+
+    def get_page(self, cursor):
+        direction, key = decode_cursor(cursor)
+        if isinstance(self.object_list, QuerySet):
+            items = self._slice_queryset(direction, key)
+        else:
+            items = self._slice_sequence(direction, key)
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if direction == NEXT:
+            has_next, has_previous = has_more, key is not None
+        else:
+            items.reverse()
+            has_next, has_previous = True, has_more
+        next_cursor = previous_cursor = None
+        if items and has_next:
+            next_cursor = encode_cursor(NEXT, items[-1])
+        if items and has_previous:
+            previous_cursor = encode_cursor(PREVIOUS, items[0])
+        return CursorPage(items, cursor or '', next_cursor, previous_cursor)
+
+    def _slice_queryset(self, direction, key):
+        queryset = self.object_list
+        if direction == NEXT:
+            ordering = ('-pub_date', '-pk')
+            if key is not None:
+                pub_date, pk = key
+                queryset = queryset.filter(
+                    Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk)
+                )
+        else:
+            ordering = ('pub_date', 'pk')
+            pub_date, pk = key
+            queryset = queryset.filter(
+                Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+            )
+        # Лишний объект показывает, есть ли страница дальше
+        return list(queryset.order_by(*ordering)[:self.per_page + 1])
+
+    def _slice_sequence(self, direction, key):
+        """То же для списка, уже отсортированного по убыванию (pub_date, pk).
+
+        Нужно для ленты, собранной слиянием в памяти.
+        """
+        items = self.object_list
+        if direction == NEXT:
+            if key is not None:
+                items = (i for i in items if (i.pub_date, i.pk) < key)
+        else:
+            items = (i for i in reversed(items) if (i.pub_date, i.pk) > key)
+        return list(islice(items, self.per_page + 1))
@@ -0,0 +1,189 @@
+"""Полнотекстовый поиск по постам.
+
+На SQLite тексты постов лежат в таблице FTS5 posts_post_fts (rowid - id
+поста), которая обновляется сигналами при сохранении и удалении поста.
+Результаты ранжируются по bm25, совпадения подсвечиваются через
+snippet(), а страницы листаются курсором по (ранг, id) без OFFSET.
+
+На других базах поиск сводится к icontains по тексту, новые посты
+первыми.
+"""
+import base64
+import binascii
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .paginators import CursorPage
+
+TABLE = 'posts_post_fts'
+LIMIT = 10
+# Сколько слов вокруг совпадения показывать в сниппете
+SNIPPET_TOKENS = 16
+# Границы совпадения в сниппете: управляющие символы, которых нет в
+# тексте после экранирования, заменяются на <mark>
+MARK_START, MARK_END = '\x02', '\x03'
+
+WORD_RE = re.compile(r'\w+')
+
+# То же, что _normalize, но внутри базы
+REBUILD_SQL = (
+    f"INSERT INTO {TABLE} (rowid, text) "
+    f"SELECT id, replace(replace(text, 'ё', 'е'), 'Ё', 'Е') FROM posts_post"
+)
+
+
+def is_supported():
+    return connection.vendor == 'sqlite'
+
+
+def _normalize(text):
+    # unicode61 не считает "ё" буквой "е" с диакритикой
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def build_query(text):
+    """Запрос FTS5 из ввода: все слова, последнее - как префикс.
+
+    Операторы FTS5 из ввода не пропускаются: каждое слово в кавычках.
+    """
+    words = WORD_RE.findall(_normalize(text))
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def index_post(post_id, text):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, text) VALUES (%s, %s)',
+            [post_id, _normalize(text)],
+        )
+
+
+def index_posts(posts):
+    """Добавляет в индекс новые посты одним запросом."""
+    if not is_supported() or not posts:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, text) VALUES (%s, %s)',
+            [(post.pk, _normalize(post.text)) for post in posts],
+        )
+
+
+def unindex_post(post_id):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild():
+    """Строит индекс заново по всем постам; возвращает их число."""
+    if not is_supported():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute(REBUILD_SQL)
+        return cursor.rowcount
+
+
+def matching_ids(text):
+    """Подзапрос id постов, подходящих под поиск, для фильтра pk__in."""
+    query = build_query(text)
+    return (
+        f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s', [query]
+    )
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+def encode_cursor(rank, pk):
+    raw = f'{rank!r}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(ранг, id) из токена; для пустого или битого - None."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        rank, pk = raw.decode().split('|')
+        return float(rank), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def _ranked(query, after, limit):
+    sql = (
+        f'SELECT rowid, rank, '
+        f'snippet({TABLE}, 0, %s, %s, %s, %s) '
+        f'FROM {TABLE} WHERE {TABLE} MATCH %s'
+    )
+    params = [MARK_START, MARK_END, '…', SNIPPET_TOKENS, query]
+    if after is not None:
+        sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+        params += [after[0], after[0], after[1]]
+    sql += ' ORDER BY rank, rowid LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _fallback(text, after, limit):
+    posts = Post.objects.filter(text__icontains=text.strip())
+    if after is not None:
+        posts = posts.filter(pk__lt=after[1])
+    return [
+        (pk, 0.0, text)
+        for pk, text in posts.order_by('-pk').values_list(
+            'pk', 'text')[:limit]
+    ]
+
+
+def search(text, cursor=None, limit=LIMIT):
+    """Страница результатов: посты с атрибутами search_rank и snippet.
+
+    Курсор ведёт только вперёд, на следующую страницу.
+    """
+    after = decode_cursor(cursor)
+    query = build_query(text)
+    if not query:
+        return CursorPage([], cursor or '', None, None)
+    if is_supported():
+        rows = _ranked(query, after, limit + 1)
+    else:
+        rows = _fallback(text, after, limit + 1)
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [pk for pk, _, _ in rows])
+    results = []
+    for pk, rank, snippet in rows:
+        post = posts.get(pk)
+        if post is None:
+            continue
+        post.search_rank = rank
+        post.snippet = highlight(snippet)
+        results.append(post)
+    next_cursor = None
+    if has_next and rows:
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    return CursorPage(results, cursor or '', next_cursor, None)
@@ -0,0 +1,213 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core import cache as fragments
+
+from . import counters, feeds, images, search, uploads
+from .models import Comment, Follow, Group, Post, User, UserCounters
+from .utils import group_scopes, post_scopes
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    """Новый пост попадает в ленты подписчиков автора."""
+    if created and not raw:
+        feeds.fan_out([instance])
+
+
+@receiver(post_delete, sender=Post)
+def forget_post(sender, instance, **kwargs):
+    """Удалённый пост не должен остаться в кеше постов автора."""
+    feeds.invalidate_author(instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, raw=False, **kwargs):
+    """После подписки в ленту добавляются посты автора."""
+    if created and not raw:
+        feeds.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clean_feed(sender, instance, **kwargs):
+    """После отписки посты автора убираются из ленты."""
+    feeds.remove(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=User)
+def create_counters(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserCounters.objects.create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    """Запоминает группу до сохранения: её смену видят счётчики и кеш."""
+    loaded = getattr(instance, '_loaded', {})
+    if instance._state.adding:
+        instance._old_group_id = None
+    else:
+        # Если пост загружен не из базы, считаем, что группа не менялась
+        instance._old_group_id = loaded.get('group_id', instance.group_id)
+    instance._loaded = dict(loaded, group_id=instance.group_id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_upload(sender, instance, **kwargs):
+    """Новая загруженная картинка ещё не сохранена в хранилище."""
+    instance._image_uploaded = bool(
+        instance.image) and not instance.image._committed
+    loaded = getattr(instance, '_loaded', {})
+    if instance._state.adding:
+        instance._old_image = ''
+    else:
+        # None - прежняя картинка неизвестна, ссылки не трогаем
+        instance._old_image = loaded.get('image')
+
+
+@receiver(pre_save, sender=Post)
+def store_image_metadata(sender, instance, raw=False, update_fields=None,
+                         **kwargs):
+    """Метаданные пересчитываются, только когда сменилась картинка."""
+    if raw or (update_fields is not None and 'image' not in update_fields):
+        return
+    loaded = getattr(instance, '_loaded', {})
+    changed = (instance.image.name or '') != (loaded.get('image') or '')
+    if instance._image_uploaded or changed and (
+            instance._state.adding or 'image' in loaded):
+        images.update_metadata(instance)
+
+
+@receiver(post_save, sender=Post)
+def process_upload(sender, instance, raw=False, **kwargs):
+    """Новая картинка обрабатывается в фоне после коммита."""
+    if instance._image_uploaded and not raw:
+        post_id, name = instance.pk, instance.image.name
+        transaction.on_commit(lambda: uploads.schedule(post_id, name))
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, raw=False, **kwargs):
+    """Счётчики постов автора и группы, в том числе при смене группы."""
+    if raw:
+        return
+    old_group_id = instance._old_group_id
+    with transaction.atomic():
+        if created:
+            counters.change_user(instance.author_id, posts_count=1)
+        if old_group_id != instance.group_id:
+            if old_group_id:
+                counters.change_group(old_group_id, -1)
+            if instance.group_id:
+                counters.change_group(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    with transaction.atomic():
+        counters.change_user(instance.author_id, posts_count=-1)
+        if instance.group_id:
+            counters.change_group(instance.group_id, -1)
+        counters.change_image(instance.image.name, -1)
+
+
+@receiver(post_save, sender=Post)
+def count_image(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Ссылки на файлы картинок при смене картинки поста."""
+    if raw or (update_fields is not None and 'image' not in update_fields):
+        return
+    old, new = instance._old_image, instance.image.name or ''
+    if old is None or old == new:
+        return
+    with transaction.atomic():
+        counters.change_image(new, 1)
+        counters.change_image(old, -1)
+    # Имя файла известно только после сохранения
+    instance._loaded = dict(getattr(instance, '_loaded', {}), image=new)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    counters.change_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        with transaction.atomic():
+            counters.change_user(instance.author_id, followers_count=1)
+            counters.change_user(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    with transaction.atomic():
+        counters.change_user(instance.author_id, followers_count=-1)
+        counters.change_user(instance.user_id, following_count=-1)
+
+
+@receiver(post_delete, sender=Follow)
+def demote_author(sender, instance, **kwargs):
+    """Счётчик уже уменьшен: автор мог перестать быть популярным."""
+    feeds.check_demotion(instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, update_fields=None, **kwargs):
+    """Полнотекстовый индекс обновляется вместе с текстом поста."""
+    if update_fields is None or 'text' in update_fields:
+        search.index_post(instance.pk, instance.text)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.unindex_post(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_fragments(sender, instance, **kwargs):
+    """Пост виден на главной, в группе, в профиле и на своей странице."""
+    fragments.bump_on_commit(*post_scopes(
+        instance.pk,
+        instance.author_id,
+        instance.group_id,
+        getattr(instance, '_old_group_id', None),
+    ))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_fragments(sender, instance, **kwargs):
+    fragments.bump_on_commit(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_fragments(sender, instance, **kwargs):
+    """Счётчики подписок в профилях и кнопка подписки у подписчика."""
+    fragments.bump_on_commit(
+        f'follows:{instance.author_id}', f'follows:{instance.user_id}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_fragments(sender, instance, **kwargs):
+    """Группа видна на главной, в своей ленте и на страницах постов."""
+    fragments.bump_on_commit(*group_scopes(instance.pk))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_fragments(sender, instance, created, update_fields=None,
+                              **kwargs):
+    """Имя автора выводится на всех лентах; вход в систему не в счёт."""
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    fragments.bump_on_commit(fragments.SITE)
@@ -0,0 +1,60 @@
+import logging
+
+from django import template
+
+from .. import thumbnails
+
+register = template.Library()
+logger = logging.getLogger(__name__)
+
+
+# Ширина картинки в карточке: контейнер до 960 пикселей или весь экран
+CARD_SIZES = '(min-width: 992px) 960px, 100vw'
+
+
+def _srcset(thumbnails_):
+    return ', '.join(
+        f'{thumbnail.url} {thumbnail.width}w' for thumbnail in thumbnails_)
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(image, sizes=CARD_SIZES):
+    """<picture> с вариантами карточки, а пока их нет - оригинал.
+
+    В отличие от {% thumbnail %} не создаёт миниатюры во время запроса,
+    а ставит их создание в фоновую очередь: {% post_picture post.image %}
+    """
+    if not image:
+        return {'image': None}
+    try:
+        picture = thumbnails.picture(image)
+    except Exception:
+        logger.exception('Не удалось найти миниатюры %s', image)
+        return {'image': thumbnails.original(image)}
+    if picture is None:
+        thumbnails.schedule(image.name)
+        return {'image': thumbnails.original(image)}
+    sources = [
+        {'type': type_, 'srcset': _srcset(variants)}
+        for type_, variants in picture.sources
+    ]
+    return {
+        'image': picture.fallback,
+        # Последний <source> - JPEG: его srcset нужен и самому <img>
+        'sources': sources[:-1],
+        'srcset': sources[-1]['srcset'],
+        'sizes': sizes,
+    }
+
+
+@register.simple_tag
+def prefetch_thumbnails(posts):
+    """Готовит миниатюры всех постов страницы одним запросом к кешу.
+
+    Ставится перед циклом по постам: {% prefetch_thumbnails page_obj %}
+    """
+    try:
+        thumbnails.prefetch(posts)
+    except Exception:
+        logger.exception('Не удалось получить миниатюры страницы')
+    return ''
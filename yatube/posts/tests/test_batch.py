@@ -0,0 +1,144 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import cache as fragments
+
+from .. import batch, search
+from ..models import Comment, FeedEntry, Follow, Group, Post
+
+User = get_user_model()
+
+
+class BatchCreateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.post = Post.objects.create(author=self.reader, text='Старый')
+        self.client.force_login(self.author)
+        self.url = reverse('posts:batch_create')
+
+    def send(self, data):
+        return self.client.post(
+            self.url, json.dumps(data), content_type='application/json')
+
+    def test_creates_posts_and_comments(self):
+        posts = [
+            {'text': f'Пакетный пост {i}', 'group': self.group.pk}
+            for i in range(5)
+        ]
+        comments = [
+            {'post': self.post.pk, 'text': f'Комментарий {i}'}
+            for i in range(3)
+        ]
+        response = self.send({'posts': posts, 'comments': comments})
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        ids = [item['id'] for item in result['posts']]
+        self.assertEqual(
+            list(Post.objects.filter(pk__in=ids).order_by('pk')
+                 .values_list('text', flat=True)),
+            [post['text'] for post in posts])
+        self.assertEqual(
+            set(Comment.objects.values_list('pk', flat=True)),
+            {item['id'] for item in result['comments']})
+        self.author.counters.refresh_from_db()
+        self.group.refresh_from_db()
+        self.post.refresh_from_db()
+        self.assertEqual(self.author.counters.posts_count, 5)
+        self.assertEqual(self.group.posts_count, 5)
+        self.assertEqual(self.post.comments_count, 3)
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.reader).count(), 5)
+        self.assertEqual(
+            {post.pk for post in search.search('пакетный')}, set(ids))
+
+    def test_per_item_errors(self):
+        response = self.send({
+            'posts': [{'text': ''}, {'text': 'Хороший'}, 'строка'],
+            'comments': [{'post': 0, 'text': 'Куда?'}],
+        })
+        result = response.json()
+        self.assertIn('text', result['posts'][0]['errors'])
+        self.assertIn('id', result['posts'][1])
+        self.assertIn('__all__', result['posts'][2]['errors'])
+        self.assertIn('post', result['comments'][0]['errors'])
+        self.assertEqual(Post.objects.filter(text='Хороший').count(), 1)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_malformed_post_ids(self):
+        response = self.send({'comments': [
+            {'post': [self.post.pk], 'text': 'Список'},
+            {'post': True, 'text': 'Булево'},
+            {'post': str(self.post.pk), 'text': 'Строка'},
+            {'text': 'Без поста'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        for item in response.json()['comments']:
+            self.assertIn('post', item['errors'])
+        self.assertFalse(Comment.objects.exists())
+
+    def test_side_effects_once_per_batch(self):
+        """Число запросов не растёт с размером пакета."""
+        def queries(size):
+            with CaptureQueriesContext(connection) as captured:
+                self.send({
+                    'posts': [{'text': 'Пост'}] * size,
+                    'comments': [
+                        {'post': self.post.pk, 'text': 'Ком'}] * size,
+                })
+            return len(captured)
+        self.assertEqual(queries(2), queries(20))
+
+    def test_new_posts_visible_on_cached_pages(self):
+        index = reverse('posts:index')
+        self.client.get(index)
+        self.send({'posts': [{'text': 'Свежий пакетный пост'}]})
+        self.assertContains(self.client.get(index), 'Свежий пакетный пост')
+
+    @override_settings(BATCH_MAX_ITEMS=2)
+    def test_bad_requests(self):
+        for body in ('не json', '[]', '{"posts": {}}'):
+            with self.subTest(body=body):
+                response = self.client.post(
+                    self.url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+        response = self.send({'posts': [{'text': 'Пост'}] * 3})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+
+class BatchWithoutTransactionTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def test_falls_back_to_save(self):
+        """Вне транзакции id по порядку не угадать: save() по одному."""
+        result = batch.create_posts(
+            self.author, [{'text': 'Первый'}, {'text': 'Второй'}])
+        posts = Post.objects.in_bulk([item['id'] for item in result])
+        self.assertEqual(
+            [posts[item['id']].text for item in result],
+            ['Первый', 'Второй'])
+        self.author.counters.refresh_from_db()
+        self.assertEqual(self.author.counters.posts_count, 2)
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.reader).count(), 2)
+
+    def test_bump_after_commit(self):
+        """Версия, видная до коммита пачки, после него уже другая."""
+        with transaction.atomic():
+            batch.create(self.author, posts=[{'text': 'Пост'}])
+            during = fragments.get_version('posts')
+        self.assertNotEqual(fragments.get_version('posts'), during)
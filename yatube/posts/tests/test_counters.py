@@ -0,0 +1,177 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from .. import counters
+from ..models import Comment, Follow, Group, Post, StoredImage, UserCounters
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='counter_slug',
+            description='Тестовое описание',
+        )
+        self.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other_slug',
+            description='Тестовое описание',
+        )
+
+    def counters(self, user):
+        return UserCounters.objects.get(user=user)
+
+    def test_post_counters(self):
+        """Создание, перенос и удаление поста меняют счётчики."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group)
+        self.assertEqual(self.counters(self.user).posts_count, 1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        post = Post.objects.get(pk=post.pk)
+        post.group = self.other_group
+        post.save()
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(self.other_group.posts_count, 1)
+        post.delete()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.counters(self.user).posts_count, 0)
+        self.assertEqual(self.other_group.posts_count, 0)
+
+    def test_comment_and_follow_counters(self):
+        """Комментарии и подписки меняют счётчики."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.assertEqual(self.counters(self.user).followers_count, 1)
+        self.assertEqual(self.counters(self.reader).following_count, 1)
+        Follow.objects.all().delete()
+        self.assertEqual(self.counters(self.user).followers_count, 0)
+        self.assertEqual(self.counters(self.reader).following_count, 0)
+
+    def test_comment_rolls_back_with_counters(self):
+        """Комментарий не сохраняется, если не удалось обновить счётчик."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        client = Client()
+        client.force_login(self.reader)
+        url = reverse('posts:add_comment', kwargs={'post_id': post.pk})
+        with mock.patch.object(
+                counters, 'change_post', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                client.post(url, {'text': 'Комментарий'})
+        self.assertFalse(Comment.objects.exists())
+
+    def test_recount_command(self):
+        """recount_counters чинит разошедшиеся счётчики."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group)
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        UserCounters.objects.all().delete()
+        Post.objects.update(comments_count=7)
+        Group.objects.update(posts_count=7)
+        call_command('recount_counters', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(self.counters(self.user).posts_count, 1)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+
+    def test_profile_reads_counters(self):
+        """Профиль берёт число постов из счётчика, а не из COUNT."""
+        Post.objects.create(author=self.user, text='Пост')
+        url = reverse('posts:profile', kwargs={'username': 'auth'})
+        with CaptureQueriesContext(connection) as queries:
+            response = Client().get(url + '?cursor=')
+        self.assertEqual(response.context['posts_count'], 1)
+        for query in queries:
+            self.assertNotIn('COUNT(', query['sql'])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, BACKGROUND_WORKERS=0)
+class ImageReferenceTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+
+    def image(self, color='red'):
+        output = BytesIO()
+        Image.new('RGB', (2, 1), color).save(output, 'PNG')
+        return SimpleUploadedFile('image.png', output.getvalue())
+
+    def create(self):
+        return Post.objects.create(
+            author=self.user, text='Пост', image=self.image())
+
+    def references(self):
+        return dict(StoredImage.objects.values_list('name', 'references'))
+
+    def test_references(self):
+        """Посты с одинаковой картинкой ссылаются на один файл."""
+        first = self.create()
+        second = self.create()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(self.references(), {first.image.name: 2})
+        second = Post.objects.get(pk=second.pk)
+        second.image = self.image('blue')
+        second.save()
+        second.save()
+        self.assertEqual(self.references(), {
+            first.image.name: 1,
+            second.image.name: 1,
+        })
+        first.delete()
+        self.assertEqual(self.references()[first.image.name], 0)
+        StoredImage.objects.update(references=7)
+        list(counters.recount_all())
+        self.assertEqual(self.references(), {
+            first.image.name: 0,
+            second.image.name: 1,
+        })
+
+    def test_dedupe_images_command(self):
+        """Старые имена файлов заменяются хешами, дубликаты сливаются."""
+        storage = Post._meta.get_field('image').storage
+        os.makedirs(storage.path('posts'), exist_ok=True)
+        for name in ('posts/old.png', 'posts/copy.png'):
+            with open(storage.path(name), 'wb') as file_:
+                file_.write(self.image().read())
+            post = Post.objects.create(
+                author=self.user, text='Старый пост', image=name)
+        out = StringIO()
+        call_command('dedupe_images', stdout=out)
+        self.assertIn('Перенесено: 2, ошибок: 0', out.getvalue())
+        names = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        post.refresh_from_db()
+        self.assertEqual(self.references()[post.image.name], 2)
+        self.assertEqual(self.references()['posts/old.png'], 0)
@@ -0,0 +1,189 @@
+import base64
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import feeds
+from ..models import FeedEntry, Follow, Post
+
+User = get_user_model()
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.author = User.objects.create_user(username='writer')
+
+    def feed(self):
+        return list(
+            FeedEntry.objects.filter(user=self.reader).values_list(
+                'post_id', flat=True)
+        )
+
+    def test_new_post_fans_out(self):
+        """Новый пост попадает в ленту подписчика."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Пост')
+        self.assertEqual(self.feed(), [post.pk])
+
+    def test_follow_backfills_and_unfollow_cleans(self):
+        """Подписка дополняет ленту, отписка очищает."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.feed(), [post.pk])
+        Follow.objects.filter(user=self.reader, author=self.author).delete()
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(FEED_MAX_ENTRIES=3)
+    def test_feed_is_capped(self):
+        """В ленте хранится не больше FEED_MAX_ENTRIES записей."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            for i in range(5)
+        ]
+        self.assertEqual(
+            sorted(self.feed()), sorted(post.pk for post in posts[-3:]))
+
+    def test_feed_pages(self):
+        """Страницы ленты по номеру и по курсору читаются из FeedEntry."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            for i in range(12)
+        ][::-1]
+        client = Client()
+        client.force_login(self.reader)
+        url = reverse('posts:follow_index')
+        page = client.get(url + '?page=2').context['page_obj']
+        self.assertEqual(page.paginator.num_pages, 2)
+        self.assertEqual(list(page), posts[10:])
+        page = client.get(url + '?cursor=').context['page_obj']
+        self.assertEqual(list(page), posts[:10])
+        page = client.get(
+            url + '?cursor=' + page.next_cursor).context['page_obj']
+        self.assertEqual(list(page), posts[10:])
+
+    def test_fan_out_queries_do_not_grow_with_followers(self):
+        """Обрезка лент - один запрос, а не запрос на подписчика."""
+        def queries(followers):
+            author = User.objects.create_user(username=f'a{followers}')
+            for index in range(followers):
+                Follow.objects.create(
+                    user=User.objects.create_user(
+                        username=f'f{followers}-{index}'),
+                    author=author)
+            post = Post.objects.create(author=author, text='Пост')
+            with CaptureQueriesContext(connection) as captured:
+                feeds.fan_out([post])
+            return len(captured)
+
+        self.assertEqual(queries(2), queries(6))
+
+    def test_rebuild_command(self):
+        """Команда rebuild_feeds восстанавливает ленты."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Пост')
+        FeedEntry.objects.all().delete()
+        call_command('rebuild_feeds', stdout=StringIO())
+        self.assertEqual(self.feed(), [post.pk])
+
+
+@override_settings(FEED_FANOUT_THRESHOLD=1)
+class HybridFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.star = User.objects.create_user(username='star')
+        self.author = User.objects.create_user(username='writer')
+        fan = User.objects.create_user(username='fan')
+        Follow.objects.create(user=fan, author=self.star)
+        Follow.objects.create(user=self.reader, author=self.star)
+        Follow.objects.create(user=self.reader, author=self.author)
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_popular_author_is_not_fanned_out(self):
+        """Посты популярного автора не пишутся в ленты."""
+        Post.objects.create(author=self.star, text='Пост звезды')
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+
+    def test_feed_merges_popular_authors(self):
+        """Лента сливает материализованные записи и посты звезды."""
+        posts = [
+            Post.objects.create(author=author, text=f'Пост {i}')
+            for i, author in enumerate([self.star, self.author] * 6)
+        ]
+        response = self.client.get(reverse('posts:follow_index'))
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 10)
+        self.assertEqual(page[0], posts[-1])
+        self.assertIsInstance(page[0], Post)
+        response = self.client.get(
+            reverse('posts:follow_index') + '?page=2')
+        self.assertEqual(len(response.context['page_obj']), 2)
+        response = self.client.get(
+            reverse('posts:follow_index') + '?cursor=')
+        self.assertEqual(list(response.context['page_obj']), list(page))
+
+    def test_cursor_pages_of_merged_feed(self):
+        """Переходы по курсору в обе стороны в гибридной ленте."""
+        posts = [
+            Post.objects.create(author=author, text=f'Пост {i}')
+            for i, author in enumerate([self.star, self.author] * 12)
+        ]
+        url = reverse('posts:follow_index')
+        first = self.client.get(url + '?cursor=').context['page_obj']
+        second = self.client.get(
+            url + '?cursor=' + first.next_cursor).context['page_obj']
+        self.assertEqual(list(second), posts[::-1][10:20])
+        back = self.client.get(
+            url + '?cursor=' + second.previous_cursor).context['page_obj']
+        self.assertEqual(list(back), list(first))
+        response = self.client.get(url + '?page=2')
+        self.assertEqual(list(response.context['page_obj']), list(second))
+
+    def test_naive_cursor_opens_first_page(self):
+        """Курсор с датой без часового пояса - первая страница."""
+        Post.objects.create(author=self.star, text='Пост звезды')
+        token = base64.urlsafe_b64encode(
+            b'n|2030-01-01T00:00:00|5').decode().rstrip('=')
+        response = self.client.get(
+            reverse('posts:follow_index') + '?cursor=' + token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 1)
+
+
+@override_settings(FEED_FANOUT_THRESHOLD=1, BACKGROUND_WORKERS=0)
+class DemotionTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.fan = User.objects.create_user(username='fan')
+        self.star = User.objects.create_user(username='star')
+        Follow.objects.create(user=self.reader, author=self.star)
+        Follow.objects.create(user=self.fan, author=self.star)
+        cache.clear()
+
+    def test_demoted_author_is_backfilled(self):
+        """Посты автора, опустившегося до порога, остаются в лентах."""
+        post = Post.objects.create(author=self.star, text='Пост звезды')
+        self.assertFalse(FeedEntry.objects.exists())
+        Follow.objects.filter(user=self.fan, author=self.star).delete()
+        self.assertEqual(
+            list(FeedEntry.objects.values_list('user_id', 'post_id')),
+            [(self.reader.pk, post.pk)],
+        )
+        newer = Post.objects.create(author=self.star, text='Новый пост')
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, post=newer).exists())
@@ -1,3 +1,4 @@
+import hashlib
 import tempfile
 import shutil
 
@@ -14,7 +15,8 @@ User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT + '/media/')
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT + '/media/', BACKGROUND_WORKERS=0)
 class PostCreatFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -92,7 +94,12 @@ class PostCreatFormTests(TestCase):
         self.assertEqual(Post.objects.count(), posts_count + 1)
         self.assertTrue(Post.objects.filter(text='Тестовая запись').exists())
         self.assertEqual(post.group_id, form_data['group'])
-        self.assertEqual(post.image.name, 'posts/' + uploaded.name)
+        # Имя файла - хеш содержимого (core.storage)
+        digest = hashlib.sha256(self.small_gif).hexdigest()
+        self.assertEqual(
+            post.image.name,
+            f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif',
+        )
 
     def test_form_image(self):
         empty_form = (b'')
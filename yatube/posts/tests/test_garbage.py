@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+from sorl.thumbnail import default
+
+from .. import garbage, thumbnails
+from ..models import Post, StoredImage
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+NOW = timedelta(0)
+
+
+def tearDownModule():
+    shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, BACKGROUND_WORKERS=0)
+class GarbageTests(TestCase):
+    def setUp(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        cache.clear()
+        user = User.objects.create_user(username='auth')
+        self.kept = Post.objects.create(
+            author=user, text='Пост', image=self.image('red'))
+        self.deleted = Post.objects.create(
+            author=user, text='Удалённый пост', image=self.image('blue'))
+        thumbnails.generate(self.kept.image.name)
+        thumbnails.generate(self.deleted.image.name)
+        self.deleted.delete()
+        self.orphan = self.write('posts/orphan.png')
+        self.write('unrelated/file.txt')
+        self.age_files()
+
+    def image(self, color):
+        output = BytesIO()
+        Image.new('RGB', (1000, 400), color).save(output, 'PNG')
+        return SimpleUploadedFile('image.png', output.getvalue())
+
+    def write(self, name):
+        path = os.path.join(TEMP_MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file_:
+            file_.write(b'x')
+        return name
+
+    def age_files(self):
+        old = time.time() - 7 * 24 * 3600
+        for name, entry in garbage.walk(TEMP_MEDIA_ROOT):
+            os.utime(entry.path, (old, old))
+
+    def files(self):
+        return {name for name, _ in garbage.walk(TEMP_MEDIA_ROOT)}
+
+    def thumbnail_names(self, post):
+        return {
+            thumbnails.cached_thumbnail(
+                post.image, geometry, **options).name
+            for _, _, geometry, options in thumbnails.card_variants(
+                post.image_width, post.image_height)
+        }
+
+    def collect(self, **kwargs):
+        kwargs.setdefault('min_age', NOW)
+        return [
+            item.name for batch in garbage.collect(**kwargs) for item in batch
+        ]
+
+    def test_walk_is_sorted(self):
+        """Обход каталогов идёт в порядке сравнения строк."""
+        for name in ('a/b', 'a.txt', 'a-b', 'ab'):
+            self.write(os.path.join('sort', name))
+        names = [
+            name for name, _ in garbage.walk(TEMP_MEDIA_ROOT, 'sort/')]
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(len(names), 4)
+
+    def test_collect_removes_unreferenced(self):
+        """Удаляются картинки и миниатюры без ссылок, остальное остаётся."""
+        kept = {self.kept.image.name} | self.thumbnail_names(self.kept)
+        dead = {self.deleted.image.name} | self.thumbnail_names(self.deleted)
+        removed = self.collect(dry_run=False, batch_size=2)
+        self.assertEqual(set(removed), dead | {self.orphan})
+        self.assertEqual(removed, sorted(removed))
+        files = self.files()
+        self.assertLessEqual(kept, files)
+        self.assertFalse(dead & files)
+        self.assertIn('unrelated/file.txt', files)
+        self.assertFalse(
+            StoredImage.objects.filter(name=self.deleted.image.name).exists())
+        self.assertIsNone(default.kvstore.get(
+            thumbnails._source(self.deleted.image.name)))
+
+    def test_dry_run(self):
+        """Без --delete файлы только перечисляются."""
+        before = self.files()
+        out = StringIO()
+        call_command(
+            'collect_media_garbage', '--min-age=0', stdout=out, stderr=out)
+        self.assertEqual(self.files(), before)
+        self.assertIn('Можно убрать файлов: 5', out.getvalue())
+
+    def test_quarantine(self):
+        """Файлы переносятся в карантин с теми же путями."""
+        quarantine = os.path.join(TEMP_MEDIA_ROOT, '..', 'quarantine')
+        self.addCleanup(shutil.rmtree, quarantine, ignore_errors=True)
+        removed = self.collect(dry_run=False, quarantine=quarantine)
+        self.assertIn(self.orphan, removed)
+        for name in removed:
+            self.assertTrue(os.path.exists(os.path.join(quarantine, name)))
+            self.assertNotIn(name, self.files())
+
+    def test_fresh_files_are_kept(self):
+        """Недавние файлы и недавно отвязанные картинки не трогаются."""
+        fresh = self.write('posts/fresh.png')
+        removed = self.collect(dry_run=False, min_age=timedelta(days=1))
+        self.assertNotIn(fresh, removed)
+        self.assertNotIn(self.deleted.image.name, removed)
+        self.assertIn(self.orphan, removed)
@@ -0,0 +1,88 @@
+import hashlib
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from .. import thumbnails
+from ..models import Post
+from .test_thumbnails import SMALL_GIF
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def tearDownModule():
+    shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, BACKGROUND_WORKERS=0)
+class ImageMetadataTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                'small.gif', SMALL_GIF, content_type='image/gif'),
+        )
+
+    def test_metadata_saved_on_upload(self):
+        """При загрузке картинки сохраняются её метаданные."""
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertEqual(post.image_format, 'GIF')
+        self.assertEqual(post.image_size, len(SMALL_GIF))
+        self.assertEqual(
+            post.image_hash, hashlib.sha256(SMALL_GIF).hexdigest())
+
+    def test_metadata_cleared_with_image(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.image = None
+        post.save()
+        post.refresh_from_db()
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_hash, '')
+
+    def test_unchanged_image_not_reread(self):
+        """Сохранение без смены картинки не трогает метаданные."""
+        Post.objects.filter(pk=self.post.pk).update(image_format='PNG')
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.image_format, 'PNG')
+
+    def test_fallback_uses_stored_size(self):
+        """Пока миниатюры нет, размеры оригинала берутся из поста."""
+        post = Post.objects.get(pk=self.post.pk)
+        post.image_width, post.image_height = 640, 480
+        cache.add(thumbnails.PENDING_KEY.format(post.image.name), 1)
+        html = Template(
+            '{% load post_images %}{% post_picture post.image %}'
+        ).render(Context({'post': post}))
+        self.assertIn(f'src="{post.image.url}"', html)
+        self.assertIn('width="640" height="480"', html)
+
+    def test_backfill_command(self):
+        Post.objects.filter(pk=self.post.pk).update(
+            image_width=None, image_height=None, image_hash='')
+        Post.objects.create(
+            author=self.user, text='Битая картинка', image='posts/missing.gif')
+        out = StringIO()
+        call_command('backfill_image_metadata', batch_size=1, stdout=out)
+        self.assertIn('Обновлено: 1, не прочитано: 1', out.getvalue())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        source = default.kvstore.get(ImageFile(post.image))
+        self.assertEqual(list(source.size), [2, 1])
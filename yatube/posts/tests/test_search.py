@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import search
+from ..models import Post
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+
+    def create(self, text):
+        return Post.objects.create(author=self.user, text=text)
+
+    def found(self, query, cursor=None, limit=search.LIMIT):
+        return [post.pk for post in search.search(query, cursor, limit)]
+
+    def test_ranked_results(self):
+        """Пост, где слово встречается чаще, идёт первым."""
+        once = self.create('Кот спит на диване весь день напролёт')
+        often = self.create('Кот, кот и ещё раз кот')
+        self.create('Собака гуляет')
+        self.assertEqual(self.found('кот'), [often.pk, once.pk])
+
+    def test_prefix_and_yo(self):
+        post = self.create('Ёжик в тумане')
+        self.assertEqual(self.found('ежи'), [post.pk])
+        self.assertEqual(self.found('ТУМАН'), [post.pk])
+
+    def test_index_follows_edits_and_deletes(self):
+        post = self.create('Первая версия')
+        post.text = 'Вторая версия'
+        post.save()
+        self.assertEqual(self.found('первая'), [])
+        self.assertEqual(self.found('вторая'), [post.pk])
+        post.delete()
+        self.assertEqual(self.found('вторая'), [])
+
+    def test_snippet_is_escaped_and_highlighted(self):
+        self.create('<script>alert(1)</script> важный текст')
+        post = search.search('важный')[0]
+        self.assertIn('<mark>важный</mark>', post.snippet)
+        self.assertNotIn('<script>', post.snippet)
+
+    def test_keyset_pagination(self):
+        posts = [self.create(f'пост номер {i}') for i in range(7)]
+        seen, cursor = [], None
+        while True:
+            page = search.search('пост', cursor, limit=3)
+            seen.extend(post.pk for post in page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(sorted(seen), [post.pk for post in posts])
+
+    def test_fts_syntax_is_not_passed_through(self):
+        post = self.create('Запрос AND NEAR "кавычки"')
+        for query in ('"', 'NEAR(', 'AND', '*', '-кавычки', ''):
+            with self.subTest(query=query):
+                search.search(query)
+        self.assertEqual(self.found('кавычки"'), [post.pk])
+
+    def test_rebuild(self):
+        post = self.create('Потерянный пост')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.TABLE}')
+        self.assertEqual(self.found('потерянный'), [])
+        self.assertEqual(search.rebuild(), 1)
+        self.assertEqual(self.found('потерянный'), [post.pk])
+
+    def test_search_page(self):
+        self.create('Текст про <b>жирный</b> шрифт')
+        response = self.client.get(reverse('posts:search'), {'q': 'жирный'})
+        self.assertContains(response, '<mark>жирный</mark>')
+        self.assertContains(response, '&lt;b&gt;')
+        response = self.client.get(reverse('posts:search'), {'q': 'нет'})
+        self.assertContains(response, 'Ничего не найдено')
+
+    def test_admin_search_uses_index(self):
+        post = self.create('Админский поиск')
+        self.create('Другой пост')
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'админский'})
+        self.assertEqual(
+            [obj.pk for obj in response.context['cl'].result_list],
+            [post.pk])
+        for query in queries:
+            self.assertNotIn('LIKE', query['sql'])
@@ -0,0 +1,154 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from core import cache as fragments
+
+from .. import thumbnails
+from ..models import Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+TAG = Template('{% load post_images %}{% post_picture post.image %}')
+
+
+def tearDownModule():
+    shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, BACKGROUND_WORKERS=0)
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                'small.gif', SMALL_GIF, content_type='image/gif'),
+        )
+
+    def render(self):
+        return TAG.render(Context({'post': self.post}))
+
+    def test_tag_falls_back_to_original(self):
+        """Пока миниатюры нет, тег отдаёт оригинал и ставит её в очередь."""
+        original = f'src="{self.post.image.url}"'
+        cache.add(thumbnails.PENDING_KEY.format(self.post.image.name), 1)
+        self.assertIn(original, self.render())
+        cache.delete(thumbnails.PENDING_KEY.format(self.post.image.name))
+        self.render()
+        html = self.render()
+        self.assertNotIn(original, html)
+        self.assertIn('/cache/', html)
+        self.assertIn('srcset=', html)
+
+    def test_generate_bumps_fragment_versions(self):
+        """Готовая миниатюра сбрасывает фрагменты с оригиналом."""
+        version = fragments.get_version(f'post:{self.post.pk}')
+        thumbnails.generate(self.post.image.name)
+        self.assertNotEqual(
+            version, fragments.get_version(f'post:{self.post.pk}'))
+
+    def test_prefetch_page(self):
+        """Миниатюры страницы находятся одним запросом к базе."""
+        for index in range(3):
+            # Картинки разные: одинаковые хранились бы одним файлом
+            output = BytesIO()
+            Image.new('RGB', (2, 1), (index, 0, 0)).save(output, 'PNG')
+            post = Post.objects.create(
+                author=self.user,
+                text=f'Пост {index}',
+                image=SimpleUploadedFile(
+                    f'{index}.png', output.getvalue(),
+                    content_type='image/png'),
+            )
+            thumbnails.generate(post.image.name)
+        posts = list(Post.objects.all())
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            thumbnails.prefetch(posts)
+        self.assertEqual(len(queries), 1)
+        with self.assertNumQueries(0):
+            found = [thumbnails.picture(post.image) for post in posts]
+        self.assertIsNone(found[-1])
+        self.assertTrue(all(found[:-1]))
+        with self.assertNumQueries(0):
+            thumbnails.prefetch(posts)
+
+    def test_empty_image(self):
+        self.post.image = ''
+        self.assertEqual(self.render().strip(), '')
+
+    def test_variants(self):
+        """Варианты не шире оригинала, WebP - если Pillow его умеет."""
+        output = BytesIO()
+        Image.new('RGB', (1000, 500), 'red').save(output, 'JPEG')
+        post = Post.objects.create(
+            author=self.user,
+            text='Большая картинка',
+            image=SimpleUploadedFile(
+                'big.jpg', output.getvalue(), content_type='image/jpeg'),
+        )
+        thumbnails.generate(post.image.name)
+        picture = thumbnails.picture(post.image)
+        self.assertEqual(picture.fallback.width, 960)
+        self.assertEqual(
+            dict(picture.sources).keys(),
+            {thumbnails.MIME_TYPES[format_]
+             for format_ in thumbnails.CARD_FORMATS},
+        )
+        for _, variants in picture.sources:
+            self.assertEqual(
+                [variant.width for variant in variants], [320, 640, 960])
+        html = TAG.render(Context({'post': post}))
+        self.assertIn('640w', html)
+        self.assertNotIn('1920w', html)
+        self.assertEqual(
+            '<source' in html, 'WEBP' in thumbnails.CARD_FORMATS)
+
+    def test_generate_thumbnails_command(self):
+        out = StringIO()
+        call_command('generate_thumbnails', workers=0, stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.assertIsNotNone(thumbnails.picture(self.post.image))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, BACKGROUND_WORKERS=0)
+class ThumbnailCommitTests(TransactionTestCase):
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_thumbnail_scheduled_after_commit(self):
+        """Миниатюра новой картинки создаётся после коммита."""
+        cache.clear()
+        user = User.objects.create_user(username='auth')
+        post = Post.objects.create(
+            author=user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                'small.gif', SMALL_GIF, content_type='image/gif'),
+        )
+        post.refresh_from_db()
+        self.assertIsNotNone(thumbnails.picture(post.image))
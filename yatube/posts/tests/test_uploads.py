@@ -0,0 +1,100 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from .. import uploads
+from ..forms import PostForm
+from ..models import Post, StoredImage
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+ORIENTATION = 0x0112
+
+
+def tearDownModule():
+    shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+
+def jpeg(size, orientation=None):
+    exif = Image.Exif()
+    if orientation:
+        exif[ORIENTATION] = orientation
+    output = BytesIO()
+    Image.new('RGB', size, 'red').save(
+        output, 'JPEG', exif=exif.tobytes(), comment=b'camera')
+    return output.getvalue()
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, BACKGROUND_WORKERS=0, IMAGE_MAX_SIDE=100)
+class UploadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+
+    def test_normalize_image(self):
+        """Картинка уменьшается, поворачивается и теряет метаданные."""
+        output = BytesIO()
+        format_ = uploads.normalize_image(
+            BytesIO(jpeg((300, 200), orientation=6)), output, 100, 10 ** 6)
+        self.assertEqual(format_, 'JPEG')
+        output.seek(0)
+        with Image.open(output) as image:
+            self.assertEqual(image.size, (67, 100))
+            self.assertNotIn('exif', image.info)
+            self.assertNotIn('comment', image.info)
+
+    def test_small_clean_image_kept(self):
+        source = BytesIO()
+        Image.new('RGB', (10, 10)).save(source, 'PNG')
+        source.seek(0)
+        self.assertIsNone(
+            uploads.normalize_image(source, BytesIO(), 100, 10 ** 6))
+
+    def test_pixel_limit(self):
+        with self.assertRaises(ValueError):
+            uploads.normalize_image(
+                BytesIO(jpeg((300, 200))), BytesIO(), 100, 1000)
+
+    def test_normalize_post(self):
+        """Оригинал поста заменяется мастер-копией."""
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост',
+            image=SimpleUploadedFile(
+                'photo.jpeg', jpeg((300, 200)), content_type='image/jpeg'),
+        )
+        original = post.image.name
+        uploads.process(post.pk)
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.name, original)
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        self.assertEqual((post.image_width, post.image_height), (100, 67))
+        references = dict(
+            StoredImage.objects.values_list('name', 'references'))
+        self.assertEqual(references, {original: 0, post.image.name: 1})
+
+    @override_settings(MAX_IMAGE_PIXELS=1000)
+    def test_form_rejects_too_many_pixels(self):
+        form = PostForm(
+            data={'text': 'Пост'},
+            files={'image': SimpleUploadedFile(
+                'big.jpg', jpeg((300, 200)), content_type='image/jpeg')},
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
+    @override_settings(MAX_UPLOAD_SIZE=10)
+    def test_form_rejects_large_file(self):
+        form = PostForm(
+            data={'text': 'Пост'},
+            files={'image': SimpleUploadedFile(
+                'big.jpg', jpeg((30, 20)), content_type='image/jpeg')},
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
@@ -1,10 +1,15 @@
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import TestCase, Client
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import Client, TestCase, TransactionTestCase
 from django.urls import reverse
 from django import forms
 
-from ..models import Group, Post, Follow
+from core import cache as fragments
+from core.testing import QueryBudgetMixin
+
+from ..models import Comment, Group, Post, Follow
 
 User = get_user_model()
 
@@ -122,15 +127,67 @@ class CacheTests(TestCase):
     def test_cache_index(self):
         """Проверка кеширования главной страницы"""
         first_update = self.authorized_client.get(reverse('posts:index'))
-        post_cache = Post.objects.get(pk=1)
-        post_cache.text = 'Тестовый пост №2'
-        post_cache.save()
+        # update() не шлёт сигналов: версия кеша не меняется
+        Post.objects.filter(pk=1).update(text='Тестовый пост №2')
         second_update = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(first_update.content, second_update.content)
         cache.clear()
         third_update = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(first_update.content, third_update.content)
 
+    def test_cache_invalidated_on_change(self):
+        """Изменение поста сразу видно на всех закешированных страницах"""
+        post = Post.objects.get(pk=1)
+        pages = [
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': 'varded'}),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        ]
+        for page in pages:
+            self.guest_client.get(page)
+        post.text = 'Исправленный пост'
+        post.save()
+        for page in pages:
+            with self.subTest(page=page):
+                self.assertContains(
+                    self.guest_client.get(page), 'Исправленный пост')
+
+    def test_comment_invalidates_post_page(self):
+        """Новый комментарий сразу виден на странице поста"""
+        url = reverse('posts:post_detail', kwargs={'post_id': 1})
+        self.guest_client.get(url)
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': 1}),
+            {'text': 'Свежий комментарий'},
+        )
+        self.assertContains(self.guest_client.get(url), 'Свежий комментарий')
+
+
+class BumpAfterCommitTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+
+    def test_version_changes_after_commit(self):
+        """Страница, сохранённая до коммита комментария, после него
+        не отдаётся: версия поднимается ещё раз"""
+        scope = f'post:{self.post.pk}'
+        with transaction.atomic():
+            Comment.objects.create(
+                post=self.post, author=self.author, text='Комментарий')
+            # Под этой версией параллельный запрос сохранил бы страницу
+            # без комментария
+            during = fragments.get_version(scope)
+        self.assertNotEqual(fragments.get_version(scope), during)
+
+    def test_single_bump_outside_transaction(self):
+        version = int(fragments.get_version('follows:1').split('.')[-1])
+        fragments.bump_on_commit('follows:1')
+        self.assertEqual(
+            int(fragments.get_version('follows:1').split('.')[-1]),
+            version + 1)
+
 
 class FollowTests(TestCase):
     def setUp(self):
@@ -228,3 +285,319 @@ class PaginatorViewsTest(TestCase):
             with self.subTest(page=page):
                 response = self.guest_client.get(page + '?page=2')
                 self.assertEqual(len(response.context['page_obj']), 3)
+
+
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='cursor')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            description='Тестовое описание группы',
+            slug='cursor_slug',
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Тестовый пост {i}',
+                author=cls.user,
+                group=cls.group,
+            )
+            for i in range(13)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.pages = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'cursor_slug'}),
+            reverse('posts:profile', kwargs={'username': 'cursor'}),
+        ]
+
+    def test_cursor_pages(self):
+        """Курсор ведёт на следующую и предыдущую страницы."""
+        for page in self.pages:
+            with self.subTest(page=page):
+                response = self.guest_client.get(page + '?cursor=')
+                first = response.context['page_obj']
+                self.assertEqual(len(first), 10)
+                self.assertFalse(first.has_previous())
+                response = self.guest_client.get(
+                    page + '?cursor=' + first.next_cursor)
+                second = response.context['page_obj']
+                self.assertEqual(len(second), 3)
+                self.assertFalse(second.has_next())
+                response = self.guest_client.get(
+                    page + '?cursor=' + second.previous_cursor)
+                self.assertEqual(
+                    list(response.context['page_obj']), list(first))
+
+    def test_cursor_page_skips_count(self):
+        """Страница по курсору не считает количество постов."""
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(self.pages[0] + '?cursor=')
+        for query in queries:
+            self.assertNotIn('COUNT(', query['sql'])
+
+    def test_broken_cursor_opens_first_page(self):
+        """Битый курсор открывает первую страницу."""
+        response = self.guest_client.get(self.pages[0] + '?cursor=broken!')
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        Post.objects.create(author=self.author, text='Пост', group=self.group)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'group'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+        )
+
+    def revalidate(self, client, url, response):
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_not_modified_without_feed_query(self):
+        """Повторный запрос с ETag получает 304 без запроса постов."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Cookie', response['Vary'])
+                self.assertIn('Last-Modified', response)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.revalidate(self.client, url, response)
+                self.assertEqual(response.status_code, 304)
+                for query in queries:
+                    self.assertNotIn('"posts_post"', query['sql'])
+
+    def test_changes_invalidate(self):
+        """Новый пост, подписка и смена пользователя меняют ETag."""
+        url = self.urls[2]
+        response = self.client.get(url)
+        Post.objects.create(author=self.author, text='Ещё пост')
+        self.assertEqual(
+            self.revalidate(self.client, url, response).status_code, 200)
+        response = self.reader_client.get(url)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(
+            self.revalidate(self.reader_client, url, response).status_code,
+            200)
+
+    def test_anonymous_and_user_are_kept_apart(self):
+        url = self.urls[0]
+        response = self.client.get(url)
+        self.assertEqual(
+            self.revalidate(self.reader_client, url, response).status_code,
+            200)
+        self.assertEqual(
+            self.revalidate(self.client, url + '?page=2', response)
+            .status_code,
+            200)
+
+    def test_missing_group(self):
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, 404)
+
+
+class PostDetailConditionalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            username='author', password='secret')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.url = reverse('posts:post_detail', args=[self.post.pk])
+
+    def test_comment_and_edit_change_updated_at(self):
+        updated_at = self.post.updated_at
+        self.author_client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': 'Комментарий'},
+        )
+        self.post.refresh_from_db()
+        self.assertGreater(self.post.updated_at, updated_at)
+        updated_at = self.post.updated_at
+        self.author_client.post(
+            reverse('posts:post_edit', args=[self.post.pk]),
+            {'text': 'Правка'},
+        )
+        self.post.refresh_from_db()
+        self.assertGreater(self.post.updated_at, updated_at)
+
+    def test_not_modified_until_comment(self):
+        response = self.author_client.get(self.url)
+        self.assertEqual(
+            response['Last-Modified'][:16],
+            self.post.updated_at.strftime('%a, %d %b %Y'))
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.author_client.get(
+                self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        for query in queries:
+            self.assertNotIn('"posts_comment"', query['sql'])
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Комментарий')
+        response = self.author_client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_relogin_changes_etag(self):
+        """После повторного входа страница с формой отдаётся заново:
+        в ней новый CSRF-токен"""
+        client = Client()
+        client.login(username='author', password='secret')
+        etag = client.get(self.url)['ETag']
+        self.assertEqual(
+            client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        client.logout()
+        client.login(username='author', password='secret')
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_anonymous_page_cache(self):
+        """Аноним получает страницу целиком из кеша, пока пост не изменён."""
+        first = self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(len(queries), 1)
+        self.author_client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': 'Новый комментарий'},
+        )
+        self.assertContains(self.client.get(self.url), 'Новый комментарий')
+        # Вошедшему пользователю чужая копия не отдаётся
+        self.assertContains(self.author_client.get(self.url), 'Редактировать')
+
+    def test_group_rename_refreshes_post_page(self):
+        """Смена названия группы поднимает версию только её области."""
+        group = Group.objects.create(title='Группа', slug='group')
+        self.post.group = group
+        self.post.save()
+        self.assertContains(self.client.get(self.url), 'Группа')
+        version = fragments.get_version(f'post:{self.post.pk}')
+        group.title = 'Новое название'
+        group.save()
+        self.assertContains(self.client.get(self.url), 'Новое название')
+        self.assertEqual(
+            fragments.get_version(f'post:{self.post.pk}'), version)
+
+    def test_missing_post(self):
+        self.assertEqual(
+            self.client.get(reverse('posts:post_detail', args=[0]))
+            .status_code,
+            404)
+
+
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.other = Group.objects.create(title='Другая', slug='other')
+        self.post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group)
+        self.pages = {
+            'index': reverse('posts:index'),
+            'group': reverse('posts:group_list', args=['group']),
+            'other': reverse('posts:group_list', args=['other']),
+            'profile': reverse('posts:profile', args=['author']),
+            'post': reverse('posts:post_detail', args=[self.post.pk]),
+        }
+
+    def cached(self):
+        """Страницы, которые аноним сейчас получит из кеша.
+
+        Из кеша страница отдаётся не больше чем за один запрос к базе:
+        поиск id группы, автора или поста для ETag.
+        """
+        cached = set()
+        for name, url in self.pages.items():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            if len(queries) <= 1:
+                cached.add(name)
+        return cached
+
+    def test_surrogate_key_header(self):
+        response = self.client.get(self.pages['post'])
+        self.assertEqual(
+            set(response['Surrogate-Key'].split()),
+            {'site', f'post:{self.post.pk}', f'author:{self.author.pk}',
+             f'group:{self.group.pk}'})
+        response = self.client.get(self.pages['group'])
+        self.assertEqual(
+            set(response['Surrogate-Key'].split()),
+            {'site', f'group:{self.group.pk}'})
+
+    def test_pages_are_cached(self):
+        self.cached()
+        self.assertEqual(self.cached(), set(self.pages))
+
+    def test_purge_only_affected_pages(self):
+        cases = (
+            (lambda: Comment.objects.create(
+                post=self.post, author=self.author, text='Комментарий'),
+             {'post'}),
+            (lambda: Follow.objects.create(
+                user=User.objects.create_user(username='reader'),
+                author=self.author),
+             {'profile'}),
+            (lambda: Group.objects.filter(pk=self.group.pk).first().save(),
+             {'index', 'group', 'post'}),
+            (lambda: Post.objects.create(
+                author=self.author, text='Новый', group=self.other),
+             # На странице поста выводится число постов автора
+             {'index', 'other', 'profile', 'post'}),
+        )
+        for change, purged in cases:
+            self.cached()
+            change()
+            with self.subTest(purged=purged):
+                self.assertEqual(self.cached(), set(self.pages) - purged)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Бюджеты запросов на холодном кеше и полной странице постов."""
+
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.reader = User.objects.create_user(username='reader')
+        authors = [
+            User.objects.create_user(username=f'author{i}') for i in range(5)
+        ]
+        for author in authors:
+            Follow.objects.create(user=self.reader, author=author)
+        for i in range(15):
+            self.post = Post.objects.create(
+                author=authors[i % 5], text=f'Пост {i}', group=self.group)
+            Comment.objects.create(
+                post=self.post, author=authors[i % 5], text='Комментарий')
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_views_within_budget(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:index') + '?cursor=',
+            reverse('posts:group_list', args=['group']),
+            reverse('posts:profile', args=['author1']),
+            reverse('posts:post_detail', args=[self.post.pk]),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            for client in (self.client, self.reader_client):
+                with self.subTest(url=url, client=client):
+                    cache.clear()
+                    self.assertWithinQueryBudget(url, client)
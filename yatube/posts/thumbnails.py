@@ -0,0 +1,234 @@
+"""Миниатюры постов, создаваемые заранее в фоновом пуле процессов.
+
+Шаблоны не создают миниатюры сами: они берут готовую из хранилища
+ключей sorl-thumbnail, а пока её нет, показывают оригинал и ставят
+создание в очередь.
+
+prefetch() находит миниатюры всех постов страницы одним get_many к
+кешу (и одним запросом к базе для промахов) вместо отдельного похода
+в хранилище ключей на каждый пост.
+
+Размеры оригинала берутся из метаданных поста (posts.images), а не из
+файла.
+
+Карточка поста выводится через <picture> с вариантами разной ширины
+(CARD_WIDTHS) в JPEG и, если Pillow его поддерживает, в WebP; браузер
+сам выбирает подходящий по srcset.
+"""
+from collections import namedtuple
+
+from django.core.cache import cache
+from PIL import features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import cache as fragments
+from core import metrics, workers
+
+from .models import Post
+from .utils import post_scopes
+
+# Ширины вариантов картинки в карточке поста и пропорции кадра
+CARD_WIDTHS = (320, 640, 960, 1920)
+CARD_RATIO = 960 / 339
+# WebP идёт первым: браузер берёт первый подходящий <source>
+CARD_FORMATS = ('WEBP', 'JPEG') if features.check('webp') else ('JPEG',)
+MIME_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+
+Variant = namedtuple('Variant', ['width', 'format', 'geometry', 'options'])
+
+CARD_VARIANTS = tuple(
+    Variant(
+        width,
+        format_,
+        f'{width}x{round(width / CARD_RATIO)}',
+        {'crop': 'center', 'upscale': False, 'format': format_},
+    )
+    for format_ in CARD_FORMATS
+    for width in CARD_WIDTHS
+)
+
+GENERATION_SECONDS = metrics.Histogram(
+    'yatube_thumbnail_seconds', 'Время создания варианта миниатюры')
+
+PENDING_KEY = 'thumbnail:pending:{}'
+# Пока ключ жив, повторно ту же картинку в очередь не ставим
+PENDING_TIMEOUT = 60
+
+Original = namedtuple('Original', ['url', 'width', 'height'])
+# sources - пары (MIME-тип, варианты по возрастанию ширины)
+Picture = namedtuple('Picture', ['fallback', 'sources'])
+
+
+def _full_options(source, options):
+    # Те же умолчания, что подставляет ThumbnailBackend.get_thumbnail:
+    # без них имя файла миниатюры не совпадёт
+    backend = default.backend
+    options = dict(options)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def _source(name):
+    # Ключи sorl зависят от хранилища исходника: оно должно быть тем же,
+    # что у поля Post.image, иначе миниатюры не найдутся
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def _thumbnail_file(file_, geometry, options):
+    source = ImageFile(file_)
+    name = default.backend._get_thumbnail_filename(
+        source, geometry, _full_options(source, options))
+    return ImageFile(name, default.storage)
+
+
+def _options_key(geometry, options):
+    return geometry, tuple(sorted(options.items()))
+
+
+def card_variants(width=None, height=None):
+    """Варианты карточки для оригинала такого размера.
+
+    Варианты шире кадра оригинала не нужны: они его не увеличивают.
+    Если размер неизвестен, нужны все.
+    """
+    if not width or not height:
+        return CARD_VARIANTS
+    limit = min(width, height * CARD_RATIO)
+    widths = [w for w in CARD_WIDTHS if w <= limit] or CARD_WIDTHS[:1]
+    return tuple(
+        variant for variant in CARD_VARIANTS if variant.width in widths)
+
+
+def cached_thumbnail(file_, geometry, **options):
+    """Готовая миниатюра или None; картинка при этом не открывается.
+
+    Если пост уже прошёл через prefetch(), хранилище не опрашивается.
+    """
+    prefetched = getattr(getattr(file_, 'instance', None), '_thumbnails', {})
+    key = _options_key(geometry, options)
+    if key in prefetched:
+        return prefetched[key]
+    return default.kvstore.get(_thumbnail_file(file_, geometry, options))
+
+
+def _get_raw_many(keys):
+    # То же, что CachedDBStore._get_raw, но для многих ключей сразу
+    kvcache = default.kvstore.cache
+    values = kvcache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        kvcache.set_many(fetched, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fetched)
+    return {
+        key: value for key, value in values.items()
+        if value and value != EMPTY_VALUE
+    }
+
+
+def prefetch(posts):
+    """Находит готовые варианты карточек для всех постов страницы.
+
+    Результат сохраняется в post._thumbnails, откуда его берёт
+    cached_thumbnail. Для других хранилищ ключей ничего не делает.
+    """
+    if not isinstance(default.kvstore, CachedDBStore):
+        return
+    wanted = {}
+    for post in posts:
+        post._thumbnails = {}
+        if not post.image:
+            continue
+        variants = card_variants(post.image_width, post.image_height)
+        for _, _, geometry, options in variants:
+            thumbnail = _thumbnail_file(post.image, geometry, options)
+            wanted.setdefault(add_prefix(thumbnail.key), []).append(
+                (post, _options_key(geometry, options)))
+    if not wanted:
+        return
+    values = _get_raw_many(list(wanted))
+    for key, targets in wanted.items():
+        thumbnail = None
+        if key in values:
+            thumbnail = deserialize_image_file(values[key])
+        for post, options_key in targets:
+            post._thumbnails[options_key] = thumbnail
+
+
+def picture(field_file):
+    """Готовые варианты карточки или None, пока нет ни одного JPEG.
+
+    fallback - вариант для src: самый широкий не шире 960 пикселей.
+    """
+    post = field_file.instance
+    ready = {}
+    for width, format_, geometry, options in card_variants(
+            post.image_width, post.image_height):
+        thumbnail = cached_thumbnail(field_file, geometry, **options)
+        if thumbnail is not None:
+            ready.setdefault(format_, []).append(thumbnail)
+    if 'JPEG' not in ready:
+        return None
+    jpegs = ready['JPEG']
+    fallback = ([jpeg for jpeg in jpegs if jpeg.width <= 960] or jpegs)[-1]
+    return Picture(fallback, [
+        (MIME_TYPES[format_], ready[format_])
+        for format_ in CARD_FORMATS if format_ in ready
+    ])
+
+
+def original(field_file):
+    """Оригинал картинки с размерами из метаданных поста."""
+    post = field_file.instance
+    return Original(field_file.url, post.image_width, post.image_height)
+
+
+def seed_source(name, width, height):
+    """Кладёт размер оригинала в хранилище ключей sorl-thumbnail.
+
+    Тогда sorl не открывает оригинал, только чтобы узнать его размер.
+    """
+    source = _source(name)
+    if width and height and default.kvstore.get(source) is None:
+        source.set_size((width, height))
+        default.kvstore.set(source)
+
+
+def generate(name):
+    """Создаёт варианты карточки; выполняется в рабочем процессе."""
+    posts = list(Post.objects.filter(image=name).values_list(
+        'pk', 'author_id', 'group_id', 'image_width', 'image_height'))
+    width = height = None
+    for *_, width, height in posts[:1]:
+        seed_source(name, width, height)
+    for variant_width, format_, geometry, options in card_variants(
+            width, height):
+        with GENERATION_SECONDS.time(width=variant_width, format=format_):
+            get_thumbnail(_source(name), geometry, **options)
+    # Фрагменты, закешированные с оригиналом вместо миниатюры, устарели
+    scopes = set()
+    for post_id, author_id, group_id, *_ in posts:
+        scopes.update(post_scopes(post_id, author_id, group_id))
+    fragments.bump(*scopes)
+
+
+def schedule(name):
+    """Ставит создание миниатюр в фоновый пул, не дожидаясь результата."""
+    if name and cache.add(PENDING_KEY.format(name), 1, PENDING_TIMEOUT):
+        workers.submit(generate, name)
@@ -0,0 +1,146 @@
+"""Обработка загруженных картинок.
+
+Запрос только проверяет загрузку по заголовку (размер файла и число
+пикселей), а сама обработка идёт в фоновом процессе после коммита:
+картинка декодируется сразу уменьшенной (draft/reduce), поворачивается
+по EXIF, теряет метаданные и сохраняется мастер-копией не больше
+IMAGE_MAX_SIDE по длинной стороне. Затем из мастер-копии создаются
+миниатюры. Одинаковые загрузки дают одинаковые мастер-копии, и
+хранилище с адресацией по содержимому хранит их один раз.
+"""
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from core import workers
+
+from . import counters, images, thumbnails
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Форматы, которые можно хранить как есть, если картинка не велика и
+# в ней нет метаданных
+KEPT_FORMATS = {'JPEG', 'PNG', 'GIF'}
+# Метаданные, которые не должны попасть в мастер-копию
+STRIPPED_INFO = {'exif', 'comment', 'XML:com.adobe.xmp', 'photoshop'}
+JPEG_QUALITY = 85
+# Во сколько раз промежуточное уменьшение через reduce может быть
+# больше итогового размера: чем меньше, тем быстрее и хуже качество
+REDUCING_GAP = 2.0
+
+
+def needs_normalizing(image, max_side):
+    return (
+        max(image.size) > max_side
+        or image.format not in KEPT_FORMATS
+        or bool(STRIPPED_INFO & set(image.info))
+    )
+
+
+def normalize_image(source, output, max_side, max_pixels):
+    """Пишет в output нормализованную копию картинки из source.
+
+    Возвращает формат копии или None, если картинку можно оставить как
+    есть. Анимации не трогаем.
+    """
+    with Image.open(source) as image:
+        if image.width * image.height > max_pixels:
+            raise ValueError(
+                f'Слишком много пикселей: {image.width}x{image.height}')
+        if getattr(image, 'is_animated', False):
+            return None
+        if not needs_normalizing(image, max_side):
+            return None
+        icc_profile = image.info.get('icc_profile')
+        # JPEG декодируется сразу в 1/2, 1/4 или 1/8 размера, но не
+        # меньше итогового; остальные форматы уменьшает reduce внутри
+        # thumbnail
+        scale = max_side / max(image.size)
+        if scale < 1:
+            image.draft(None, (
+                round(image.width * scale), round(image.height * scale)))
+        image.thumbnail((max_side, max_side), reducing_gap=REDUCING_GAP)
+        transparent = image.mode in ('RGBA', 'LA', 'PA') or (
+            'transparency' in image.info)
+        image = ImageOps.exif_transpose(image)
+        image.info = {}
+        if transparent:
+            image.convert('RGBA').save(output, 'PNG', optimize=True)
+            return 'PNG'
+        image.convert('RGB').save(
+            output,
+            'JPEG',
+            quality=JPEG_QUALITY,
+            optimize=True,
+            progressive=True,
+            icc_profile=icc_profile,
+        )
+        return 'JPEG'
+
+
+def _master_name(name, format_):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    extension = '.png' if format_ == 'PNG' else '.jpg'
+    return os.path.join(os.path.dirname(name), stem + extension)
+
+
+def normalize(post_id):
+    """Заменяет картинку поста мастер-копией; возвращает имя картинки."""
+    post = Post.objects.filter(pk=post_id).only('pk', 'image').first()
+    if post is None or not post.image:
+        return None
+    storage = post.image.storage
+    original = post.image.name
+    with tempfile.TemporaryFile() as output:
+        with storage.open(original, 'rb') as source:
+            format_ = normalize_image(
+                source,
+                output,
+                settings.IMAGE_MAX_SIDE,
+                settings.MAX_IMAGE_PIXELS,
+            )
+        if format_ is None:
+            return original
+        output.seek(0)
+        name = storage.save(_master_name(original, format_), File(output))
+    with storage.open(name, 'rb') as master:
+        metadata = images.read_metadata(master)
+    # Пока шла обработка, картинку поста могли сменить. Ни мастер-копию,
+    # ни оригинал не удаляем: на них могут ссылаться другие посты, а
+    # файлы без ссылок убирает сборщик мусора
+    with transaction.atomic():
+        if not Post.objects.filter(pk=post_id, image=original).update(
+                image=name, updated_at=timezone.now(), **metadata):
+            return None
+        counters.change_image(name, 1)
+        counters.change_image(original, -1)
+    return name
+
+
+def process(post_id):
+    """Фоновая обработка загрузки: мастер-копия, затем миниатюры."""
+    try:
+        name = normalize(post_id)
+    except Exception:
+        logger.exception('Не удалось обработать картинку поста %s', post_id)
+        name = Post.objects.filter(pk=post_id).values_list(
+            'image', flat=True).first()
+    if name:
+        thumbnails.generate(name)
+
+
+def schedule(post_id, name):
+    """Ставит обработку загрузки в фоновый пул."""
+    # Пока оригинал обрабатывается, шаблоны не должны ставить в очередь
+    # его миниатюры: их заменят миниатюры мастер-копии
+    cache.add(
+        thumbnails.PENDING_KEY.format(name), 1, thumbnails.PENDING_TIMEOUT)
+    workers.submit(process, post_id)
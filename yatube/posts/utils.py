@@ -0,0 +1,131 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.core.paginator import Paginator
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
+
+from core import cache as fragments
+
+from .paginators import CursorPaginator
+
+LIMIT: int = 10
+ANONYMOUS_PAGE_KEY = 'anonymous-page:{}'
+
+
+def get_page(request, posts):
+    """Страница ленты: по номеру (?page=) или по курсору (?cursor=)."""
+    if 'cursor' in request.GET:
+        return CursorPaginator(posts, LIMIT).get_page(request.GET['cursor'])
+    paginator = Paginator(posts, LIMIT)
+    return paginator.get_page(request.GET.get('page'))
+
+
+def post_scopes(post_id, author_id, *group_ids):
+    """Области версий фрагментного кеша, где виден пост."""
+    scopes = {'posts', f'post:{post_id}', f'author:{author_id}'}
+    scopes.update(f'group:{group_id}' for group_id in group_ids if group_id)
+    return scopes
+
+
+def group_scopes(group_id):
+    """Области, где видны название и адрес группы.
+
+    Страница поста зависит и от области своей группы, поэтому посты
+    группы по одному не перебираются.
+    """
+    return {'posts', f'group:{group_id}'}
+
+
+def page_validators(request, scopes, updated=None):
+    """ETag и Last-Modified страницы по версиям её областей.
+
+    Запрос к данным страницы не выполняется. updated - время изменения
+    объекта страницы, если оно хранится в нём самом. Для вошедшего
+    пользователя добавляется его область подписок (кнопка "Подписаться"),
+    а в ETag - его id, чтобы его страница не совпала с анонимной, и время
+    входа: после повторного входа в формах страницы новый CSRF-токен, а
+    Last-Modified при If-None-Match не проверяется.
+    """
+    user = request.user
+    variant = 'anonymous'
+    if user.is_authenticated:
+        login = user.last_login.isoformat() if user.last_login else ''
+        variant = f'user:{user.pk}:{login}'
+        scopes = (*scopes, f'follows:{user.pk}')
+    version, modified = fragments.get_validators(*scopes)
+    stamp = updated.isoformat() if updated else ''
+    etag = hashlib.md5(
+        f'{version}|{stamp}|{variant}|{request.get_full_path()}'.encode()
+    ).hexdigest()
+    if modified is None:
+        return etag, None
+    last_modified = datetime.fromtimestamp(modified, timezone.utc)
+    for moment in (updated, user.is_authenticated and user.last_login):
+        if moment:
+            last_modified = max(last_modified, moment)
+    return etag, last_modified
+
+
+def page_condition(get_state):
+    """Отвечает 304 на условный GET, не выполняя view.
+
+    get_state(request, *args, **kwargs) возвращает (области версий,
+    время изменения или None), от которых зависит страница, или None,
+    если валидатора нет (например, объекта не существует). Валидаторы
+    запоминаются в request.page_validators, а области страницы
+    отправляются в заголовке Surrogate-Key для кеша перед сайтом.
+    """
+    def decorator(view):
+        def validators(request, *args, **kwargs):
+            if not hasattr(request, 'page_validators'):
+                state = get_state(request, *args, **kwargs)
+                request.page_validators = (None, None)
+                if state is not None:
+                    request.page_validators = page_validators(
+                        request, *state)
+                    request.surrogate_keys = (fragments.SITE, *state[0])
+            return request.page_validators
+
+        conditional = vary_on_cookie(condition(
+            etag_func=lambda *args, **kwargs: validators(*args, **kwargs)[0],
+            last_modified_func=(
+                lambda *args, **kwargs: validators(*args, **kwargs)[1]),
+        )(view))
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            keys = getattr(request, 'surrogate_keys', None)
+            if keys:
+                response['Surrogate-Key'] = ' '.join(sorted(keys))
+            return response
+        return wrapper
+    return decorator
+
+
+def cache_anonymous_page(timeout):
+    """Целиком кеширует страницу для анонимов по ETag из page_condition.
+
+    ETag строится из версий областей страницы (суррогатных ключей), и
+    сохранение поста, комментария, группы или подписки, поднимая версии
+    своих областей, вычищает ровно те страницы, где они видны: их старые
+    копии больше никто не запросит.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            etag = getattr(request, 'page_validators', (None, None))[0]
+            if request.user.is_authenticated or etag is None:
+                return view(request, *args, **kwargs)
+            content = fragments.get_or_compute(
+                ANONYMOUS_PAGE_KEY.format(etag),
+                lambda: view(request, *args, **kwargs).content,
+                timeout,
+                name='anonymous_page',
+            )
+            return HttpResponse(content)
+        return wrapper
+    return decorator
@@ -1,20 +1,62 @@
-from django.core.paginator import Paginator
+import json
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.views.decorators.http import require_POST
+
+from core.queries import query_budget
+
 from .models import Post, Group, User, Follow
-from django.contrib.auth.decorators import login_required
 from .forms import PostForm, CommentForm
+from . import batch, counters, feeds
+from .search import search as search_posts
+from .utils import cache_anonymous_page, get_page, page_condition
+
+
+# Сколько хранится целая страница для анонимов
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+
+def group_state(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    return None if group_id is None else ((f'group:{group_id}',), None)
+
 
-LIMIT: float = 10
+def profile_state(request, username):
+    # Счётчики подписок автора выводятся вне кеша его постов
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    if author_id is None:
+        return None
+    return (f'author:{author_id}', f'follows:{author_id}'), None
 
 
+def post_state(request, post_id):
+    state = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id', 'updated_at').first()
+    if state is None:
+        return None
+    author_id, group_id, updated_at = state
+    scopes = (f'post:{post_id}', f'author:{author_id}')
+    if group_id:
+        # Название и адрес группы на странице поста
+        scopes += (f'group:{group_id}',)
+    return scopes, updated_at
+
+
+@query_budget(6)
+@page_condition(lambda request: (('posts',), None))
+@cache_anonymous_page(PAGE_CACHE_TIMEOUT)
 def index(request):
     """Главная страница"""
     template = 'posts/index.html'
     title = 'Последние обновления на сайте'
-    posts = Post.objects.all()
-    paginator = Paginator(posts, LIMIT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = Post.objects.select_related('author', 'group')
+    page_obj = get_page(request, posts)
     context = {
         'page_obj': page_obj,
         'title': title,
@@ -23,14 +65,15 @@ def index(request):
     return render(request, template, context)
 
 
+@query_budget(8)
+@page_condition(group_state)
+@cache_anonymous_page(PAGE_CACHE_TIMEOUT)
 def group_posts(request, slug):
     """Сборник постов"""
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, LIMIT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = group.posts.select_related('author')
+    page_obj = get_page(request, posts)
     context = {
         'page_obj': page_obj,
         'group': group,
@@ -39,14 +82,15 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@query_budget(10)
+@page_condition(profile_state)
+@cache_anonymous_page(PAGE_CACHE_TIMEOUT)
 def profile(request, username):
     template = 'posts/profile.html'
     author = get_object_or_404(User, username=username)
     posts = author.posts.all()
-    paginator = Paginator(posts, LIMIT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    posts_count = author.posts.count()
+    page_obj = get_page(request, posts)
+    author_counters = counters.for_user(author)
     if request.user.is_authenticated:
         following = Follow.objects.filter(
             user=request.user,
@@ -56,31 +100,48 @@ def profile(request, username):
     context = {
         'author': author,
         'page_obj': page_obj,
-        'posts_count': posts_count,
+        'posts_count': author_counters.posts_count,
+        'counters': author_counters,
         'following': following,
     }
     return render(request, template, context)
 
 
+@query_budget(8)
+@page_condition(post_state)
+@cache_anonymous_page(PAGE_CACHE_TIMEOUT)
 def post_detail(request, post_id):
     """Открывает страницу с отдельным постом"""
     post = get_object_or_404(
         Post
         .objects
         .select_related('author')
-        .select_related('group'),
+        .select_related('group')
+        .select_related('author__counters'),
         pk=post_id
     )
     comments = post.comments.select_related('author')
     form = CommentForm()
     context = {
         'post': post,
+        'posts_count': counters.for_user(post.author).posts_count,
         'comments': comments,
         'form': form,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def search(request):
+    """Поиск по текстам постов"""
+    query = request.GET.get('q', '')
+    page_obj = search_posts(query, request.GET.get('cursor'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     """Создание поста"""
@@ -91,7 +152,9 @@ def post_create(request):
     if request.method == 'POST' and form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        # Счётчики, лента и индекс поиска меняются в той же транзакции
+        with transaction.atomic():
+            post.save()
         return redirect('posts:profile', post.author)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -108,7 +171,8 @@ def post_edit(request, post_id):
         instance=post
     )
     if form.is_valid():
-        post = form.save()
+        with transaction.atomic():
+            post = form.save()
         return redirect('posts:post_detail', post_id)
     context = {
         'post': post,
@@ -126,18 +190,40 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@login_required
+@require_POST
+def batch_create(request):
+    """Много постов и комментариев за один запрос.
+
+    Тело - JSON {"posts": [{"text", "group"}], "comments": [{"post",
+    "text"}]}; в ответе для каждого элемента его id или ошибки.
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Тело запроса - не JSON'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Ожидается объект'}, status=400)
+    posts, comments = data.get('posts', []), data.get('comments', [])
+    if not isinstance(posts, list) or not isinstance(comments, list):
+        return JsonResponse(
+            {'error': 'posts и comments должны быть списками'}, status=400)
+    if len(posts) + len(comments) > settings.BATCH_MAX_ITEMS:
+        return JsonResponse(
+            {'error': f'Не больше {settings.BATCH_MAX_ITEMS} элементов'},
+            status=400)
+    return JsonResponse(batch.create(request.user, posts, comments))
+
+
+@query_budget(8)
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user
-    ).select_related('author', 'group')
-    paginator = Paginator(posts, LIMIT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = feeds.get_feed_page(request, request.user)
     context = {
         'page_obj': page_obj
     }
@@ -148,10 +234,11 @@ def follow_index(request):
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user.is_authenticated and request.user != author:
-        Follow.objects.get_or_create(
-            user=request.user,
-            author=author
-        )
+        with transaction.atomic():
+            Follow.objects.get_or_create(
+                user=request.user,
+                author=author
+            )
     return redirect('posts:profile', username)
 
 
@@ -162,5 +249,6 @@ def profile_unfollow(request, username):
         user=request.user,
         author=author
     )
-    follow.delete()
+    with transaction.atomic():
+        follow.delete()
     return redirect('posts:profile', username)
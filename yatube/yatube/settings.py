@@ -50,15 +50,51 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
+    'core.middleware.SlowQueryMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.TemplateTimingMiddleware',
+    'core.middleware.ProfilingMiddleware',
 ]
 
+# Заголовки X-Query-* с числом и временем запросов к базе; не для
+# продакшена
+QUERY_BUDGET_HEADERS = DEBUG
+
+# Запросы дольше этого числа миллисекунд пишутся в журнал вместе с местом
+# вызова и планом; None - не писать
+SLOW_QUERY_THRESHOLD = 100
+SLOW_QUERY_LOG = os.path.join(BASE_DIR, 'logs', 'slow_queries.log')
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+
+# Каталог файлов метрик процессов; None - метрики не собираются. Перед
+# запуском приложения его очищает команда reset_metrics. Тесты, как и
+# кеш, подменяют его через переменную окружения
+METRICS_DIR = os.environ.get(
+    'YATUBE_METRICS_DIR', os.path.join(BASE_DIR, 'metrics'))
+# Токен для /metrics (заголовок Authorization: Bearer ...); без него
+# метрики видят только сотрудники
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Профилирование запросов: доля случайно выбранных запросов, шаг
+# семплирования стека в секундах и срок действия токена X-Profile
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILE_SAMPLE_RATE = 0
+PROFILE_INTERVAL = 0.005
+PROFILE_TOKEN_MAX_AGE = 60 * 60
+
+# Время отрисовки include, block, кеша и миниатюр в заголовках
+# Server-Timing и в логе; выключенное ничего не стоит
+TEMPLATE_TIMING = False
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
@@ -132,6 +168,25 @@ USE_TZ = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Как отдавать файлы из MEDIA_ROOT: None - сам Django (FileResponse),
+# 'x-accel-redirect' - nginx, 'x-sendfile' - Apache/lighttpd
+MEDIA_SENDFILE = None
+# internal location nginx, указывающий на MEDIA_ROOT
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Функция (request, name) -> bool, решающая, можно ли отдать файл
+MEDIA_ACCESS_CHECK = 'core.media.is_public'
+
+# Загрузки всегда пишутся во временный файл, а не в память
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+# Картинки больше этого числа пикселей отклоняются (защита от
+# decompression bomb)
+MAX_IMAGE_PIXELS = 50_000_000
+# Длинная сторона мастер-копии загруженной картинки
+IMAGE_MAX_SIDE = 2560
+
 STATIC_URL = '/static/'
 
 STATICFILES_DIRS = os.path.join(BASE_DIR, 'static'),
@@ -147,8 +202,40 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# Сколько последних постов хранится в ленте подписок каждого пользователя
+FEED_MAX_ENTRIES = 1000
+# Посты авторов с большим числом подписчиков не раскладываются по лентам,
+# а сливаются с ними при чтении
+FEED_FANOUT_THRESHOLD = 1000
+FEED_AUTHOR_CACHE_TIMEOUT = 60 * 60
+
+# Сколько постов и комментариев можно создать одним запросом
+BATCH_MAX_ITEMS = 500
+
+# Процессы фонового пула (миниатюры); 0 - выполнять задачи сразу в запросе
+BACKGROUND_WORKERS = 2
+
+# Каталог общего кеша. Тесты (core.testing.TestRunner) подменяют его
+# временным через переменную окружения: её видят и процессы фонового пула
+CACHE_DIR = os.environ.get('YATUBE_CACHE_DIR', BASE_DIR)
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# Двухуровневый кеш: LRU в каждом процессе перед общим кешем в SQLite
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache_backends.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 5,
+            'COHERENCE_INTERVAL': 1,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
 }
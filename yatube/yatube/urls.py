@@ -13,10 +13,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+from urllib.parse import urlsplit
+
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from core.views import export_metrics, serve_media
 
 handler404 = 'core.views.page_not_found'
 handler500 = 'core.views.server_error'
@@ -28,9 +32,17 @@ urlpatterns = [
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('metrics', export_metrics, name='metrics'),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )
+# Медиафайлы отдаются и без DEBUG: view проверяет доступ, а передачу
+# байтов может взять на себя фронт-сервер (см. MEDIA_SENDFILE)
+if not urlsplit(settings.MEDIA_URL).netloc:
+    urlpatterns += [
+        re_path(
+            r'^{}(?P<path>.+)$'.format(
+                re.escape(settings.MEDIA_URL.lstrip('/'))),
+            serve_media,
+            name='media',
+        ),
+    ]